@@ -21,12 +21,16 @@ import random
 
 import simpy
 
+from v2.cb_trace import get_tracer
+
 
 RANDOM_SEED = 42
 RT_MEAN = 20.0         # Avg. room temperature
 RT_SIGMA = 2.0         # Sigma of room temperature
 SIM_TIME = 600  # Simulation time in seconds
 
+_trace = get_tracer('compubact')
+
 
 def temperature_dist():
     """Random normal variated temperature around RT_MEAN with RT_SIGMA"""
@@ -77,7 +81,7 @@ class ComputationalBacterium(object):
         self.listening_process = env.process(self.listening(events))
         self.message_dispatcher.register(self)
 
-        if (self.kind is 'actuator'):
+        if (self.kind == 'actuator'):
           self.msg_types = ('low temperature', 'high temperature')
         else:
           self.msg_types = ()
@@ -97,34 +101,34 @@ class ComputationalBacterium(object):
                 sleep_starts_at = self.env.now
                 yield self.env.timeout(sleep_time_left)
                 #act
-                if (self.kind is 'sensor'):
-                  print('At %.1f: %s sensing temperature = %.1f' %
-                      (self.env.now,self.name,context.ambient_temperature))
+                if (self.kind == 'sensor'):
+                  _trace.debug('At %.1f: %s sensing temperature = %.1f',
+                      self.env.now,self.name,context.ambient_temperature)
                   if (context.ambient_temperature < 18.0):
                     #event = ('actuator','low temperature')
                     event = ('actuator','low temperature')
                     yield self.events.put(event)
-                    print('At %.1f: created event %s' %(self.env.now,event))
-                elif (self.kind is 'actuator'): 
-                  print('At %.1f: %s does something' %(self.env.now,self.name))
+                    _trace.info('At %.1f: created event %s', self.env.now,event)
+                elif (self.kind == 'actuator'): 
+                  _trace.debug('At %.1f: %s does something',
+                               self.env.now,self.name)
                 else:
-                  print('Null event')
+                  _trace.debug('Null event')
                     
                 sleep_time_left = period
             except simpy.Interrupt:
                 # check event and perform action
-                print('At %.1f: %s interrupted' %
-                      (self.env.now,self.name))
+                _trace.info('At %.1f: %s interrupted', self.env.now,self.name)
                 if self.event is not None and self.event[1] in self.msg_types:
-                    print('%s processed %s' % (self.name,self.event))
+                    _trace.info('%s processed %s', self.name,self.event)
 
-                    print('actuator event caught {}'.format(self.event[1]))
-                    #if(self.event[1] is 'low temperature'):
+                    _trace.info('actuator event caught %s', self.event[1])
+                    #if(self.event[1] == 'low temperature'):
                     #  print('Low temperature event caught')
 
                     self.event = None
                     sleep_time_left = period - (self.env.now-sleep_starts_at)
-                    print('sleep_time_left %d' % sleep_time_left)
+                    _trace.debug('sleep_time_left %d', sleep_time_left)
                     
 
 
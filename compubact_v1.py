@@ -1,5 +1,5 @@
 # Print Your code here
-print('Hello in console window')
+import simpy
 
 def compbact(env,id,queue,event_type,interval):
     filter = lambda ev: ev[1] == event_type # event filter function
@@ -29,11 +29,15 @@ def eventsource(env,id,queue,interval):
         print('%s sleeps at %.1f' % (id,env.now))
         yield env.timeout(interval)
         
-import simpy
-env = simpy.Environment()
-event_queue = simpy.FilterStore(env)
-env.process(compbact(env,'001',event_queue,'A',5))
-env.process(compbact(env,'002',event_queue,'B',3))
-env.process(eventsource(env,'source',event_queue,2))
+def main():
+    print('Hello in console window')
+    env = simpy.Environment()
+    event_queue = simpy.FilterStore(env)
+    env.process(compbact(env,'001',event_queue,'A',5))
+    env.process(compbact(env,'002',event_queue,'B',3))
+    env.process(eventsource(env,'source',event_queue,2))
+
+    env.run(until=20)
 
-env.run(until=20)
\ No newline at end of file
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -16,6 +16,8 @@ of the space (target equilibrium temp is lower than actual current temp).
 
 import simpy
 
+from v2.cb_containingspace import AnalyticModel
+
 UPDATE_FREQ = 2 # times per minute
 SIM_TIME = 2000  # seconds (10 minutes)
 
@@ -46,7 +48,7 @@ class ContainedSpace(object):
             time_to_next_update = cycle_length
             while True:
                 try:
-                    cycle_start_time = env.now
+                    cycle_start_time = self.env.now
                     print('@Cycle starts at: %s' % cycle_start_time)
                     #record heat ouput and target equilibriums for computing
                     #temperature at the end of this cycle
@@ -54,7 +56,7 @@ class ContainedSpace(object):
                     equilibriums_at_start = self.compute_equilibriums()
                     print('Output is %d at: %s' %(heat_output_at_start,cycle_start_time))
                     yield self.env.timeout(time_to_next_update)
-                    time_passed = env.now - cycle_start_time
+                    time_passed = self.env.now - cycle_start_time
                     self.compute_and_set_temperature(
                         equilibriums_at_start,
                         self.cooling_gradient(time_passed),
@@ -63,11 +65,11 @@ class ContainedSpace(object):
                           (self.env.now,self.temperature))
                     time_to_next_update = cycle_length
                 except simpy.Interrupt:
-                    print('Cycle interrupted at %s' % env.now)
+                    print('Cycle interrupted at %s' % self.env.now)
                     #calculate and set temperature based on time passed
                     #until now, heat output at the start of this cycle, and
                     #the target equilibriums at the start of this cycle
-                    time_passed = env.now - cycle_start_time
+                    time_passed = self.env.now - cycle_start_time
                     self.compute_and_set_temperature(
                         equilibriums_at_start,
                         self.cooling_gradient(time_passed),
@@ -137,7 +139,7 @@ class ContainedSpace(object):
                 self.heat_sources.append(heat_source)
                 print('++ Added source %s with output %d' %
                       (heat_source.id,heat_source.output))
-                self.duty_process.interrupt()
+                self.sources_changed()
 
         def remove_heat_source(self,heat_source):
             """Remove heat_source from active sources"""
@@ -145,14 +147,33 @@ class ContainedSpace(object):
                 self.heat_sources.remove(heat_source)
                 print('-- Removed source %s with output %d' %
                       (heat_source.id,heat_source.output))
-                self.duty_process.interrupt()
+                self.sources_changed()
 
         def heat_source_output_changed(self,heat_source):
             """React to change in output of heat_source"""
             if heat_source in self.heat_sources:
                 print('** Source %s changed output to %d' %
                       (heat_source.id,heat_source.output))
-                self.duty_process.interrupt()
+                self.sources_changed()
+
+        def sources_changed(self): #private
+            """Bring the temperature up to date and restart the cycle with
+            the new heat output"""
+            self.duty_process.interrupt()
+
+
+class AnalyticContainedSpace(AnalyticModel,ContainedSpace):
+        """Closed-form variant of ContainedSpace: temperature is computed on
+        demand for env.now, no periodic process runs (see
+        v2.cb_containingspace.AnalyticModel)
+        """
+
+        def __init__(self,env,low_eq,start_temp,volume):
+            self.env = env
+            self.low_equilibrium = low_eq  # Kelvin
+            self.volume = volume           # cubic meter
+            self.heat_sources = []
+            self._start_model(start_temp)
 
 
 class HeatSource(object):
@@ -170,11 +191,11 @@ def heat_source_activity(env,space,actions):
     for action in actions:
         yield env.timeout(action[0])
         print('>> Heat source action %s' % action[1])
-        if action[1] is 'add':
+        if action[1] == 'add':
             space.add_heat_source(action[2])
-        elif action[1] is 'remove':
+        elif action[1] == 'remove':
             space.remove_heat_source(action[2])
-        elif action[1] is 'change':
+        elif action[1] == 'change':
             action[2].output = action[3]
             space.heat_source_output_changed(action[2])
         else:
@@ -264,18 +285,22 @@ def test_case_5(env):
     # End of run
     print('#### End of test_case_5 after %d seconds ####' % SIM_TIME)
 
-## run test cases
-env = simpy.Environment()
-test_case_1(env)
+def main():
+    env = simpy.Environment()
+    test_case_1(env)
+
+    env = simpy.Environment()
+    test_case_2(env)
 
-env = simpy.Environment()
-test_case_2(env)
+    env = simpy.Environment()
+    test_case_3(env)
 
-env = simpy.Environment()
-test_case_3(env)
+    env = simpy.Environment()
+    test_case_4(env)
 
-env = simpy.Environment()
-test_case_4(env)
+    env = simpy.Environment()
+    test_case_5(env)
 
-env = simpy.Environment()
-test_case_5(env)
+## run test cases
+if __name__ == '__main__':
+    main()
@@ -1,34 +1,102 @@
+import weakref
+
 
 class MessageDispatcher:
+    """Delivers broadcast messages to registered bacteria.
+
+    A bacterium registers for some topics, or for all messages (topics
+    None). A message is delivered to the bacteria registered for its topic
+    (message.topic, or the message class if it has none) and to those
+    registered for all messages, except its sender. The bacteria of the
+    topic get it first, in the order they registered, then the bacteria
+    registered for all messages, in the order they registered.
+
+    The dispatcher only holds weak references: a bacterium that is no
+    longer used elsewhere drops out without being unregistered.
+    """
 
     def __init__(self):
-        self._bacteria = []
+        self._bacteria = weakref.WeakKeyDictionary()  # bacterium -> topics
+        self._all = weakref.WeakKeyDictionary()       # registered for all
+        self._topics = {}  # topic -> WeakKeyDictionary of bacteria
         self.message_uid = 1
+
     def broadcast(self, message):
+        self._send(message, self._receivers(self._topic(message)))
+
+    def broadcast_many(self, messages):
+        """Broadcast messages in order, looking up the receivers of each
+        topic once"""
+        receivers = {}
+        for message in messages:
+            topic = self._topic(message)
+            targets = receivers.get(topic)
+            if targets is None:
+                targets = receivers[topic] = self._receivers(topic)
+            self._send(message, targets)
+
+    def register(self, bacterium, topics=None):
+        """Register bacterium for topics (all messages if None), replacing
+        an earlier registration"""
+        self.unregister(bacterium)
+        if topics is None:
+            self._all[bacterium] = None
+        else:
+            topics = tuple(topics)
+            for topic in topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is None:
+                    subscribers = self._topics[topic] = \
+                        weakref.WeakKeyDictionary()
+                subscribers[bacterium] = None
+        self._bacteria[bacterium] = topics
+
+    def unregister(self, bacterium):
+        if bacterium not in self._bacteria:
+            return
+        topics = self._bacteria.pop(bacterium)
+        if topics is None:
+            del self._all[bacterium]
+        else:
+            for topic in topics:
+                self._topics[topic].pop(bacterium, None)
+
+    def __len__(self):
+        return len(self._bacteria)
+
+    def _topic(self, message): #private
+        topic = getattr(message, 'topic', None)
+        return type(message) if topic is None else topic
+
+    def _receivers(self, topic): #private
+        #a list, so receivers can (un)register while a message is delivered
+        subscribers = self._topics.get(topic)
+        if subscribers:
+            return list(subscribers) + list(self._all)
+        return list(self._all)
+
+    def _send(self, message, receivers): #private
         message.uid = self.message_uid
         #print('-- {} Broad casting for agent# {}'.format(message.uid, message.sender.uid))
         self.message_uid += 1
 
-        for bacterium in self._bacteria:
+        for bacterium in receivers:
             if bacterium is not message.sender:
                 bacterium.receive(message)
 
-    def register(self, bacterium):
-        self._bacteria.append(bacterium)
-
-    def unregister(self, bacterium):
-        self._bacteria.remove(bacterium)
-
 
 class Message:
-    def __init__(self, sender):#, points, points_info):# position_of, x, y):
+    """A message with fixed fields; subclasses declare __slots__ for
+    their own fields to stay as compact"""
+    __slots__ = ('sender', 'topic', 'payload', 'uid')
+
+    def __init__(self, sender, topic=None, payload=None):#, points, points_info):# position_of, x, y):
         self.sender = sender
-        #self.uid = 0
+        self.topic = topic
+        self.payload = payload
+        self.uid = 0  # set by the dispatcher
         #self.position_of = position_of
         #self.x = x
         #self.y = y
         #self.points = points
         #self.points_info = points_info
-
-
-
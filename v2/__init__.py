@@ -0,0 +1,12 @@
+"""
+Computational bacteria, v2
+
+Bacteria (cb_base, cb_heater, cb_thermometer) living in spaces
+(cb_containingspace, cb_thermalengine) and talking over an event bus
+(cb_eventbus, cb_event). Importing the package or any of its modules runs
+no simulation; scenarios are started from the command line:
+
+    python -m v2 scenarios
+    python -m v2 run room --set volume=150 --until 2000
+
+"""
@@ -0,0 +1,113 @@
+"""
+Command line entry point: python -m v2 COMMAND ...
+
+    scenarios                 list the scenarios
+    run NAME [--set K=V]...   run a scenario and print its results as JSON
+    play FILE [--until T] [--fast-forward]
+                              run a scenario file (see cb_scenario), jumping
+                              over steady states (see cb_fastforward)
+    demo NAME                 run one of the demo scripts (heater, space)
+    bench|sweep|shard|ingest|replay ...
+                              the command line of cb_bench, cb_sweep, ...
+
+Modules are only imported once a command needs them.
+"""
+
+import argparse
+import importlib
+import json
+import sys
+
+TOOLS = {
+    'bench': 'cb_bench',
+    'sweep': 'cb_sweep',
+    'shard': 'cb_shard',
+    'ingest': 'cb_ingest',
+    'replay': 'cb_replay',
+}
+DEMOS = {
+    'heater': 'cb_test',
+    'space': 'cb_containingspace_test',
+}
+
+
+def _module(name):
+    return importlib.import_module('.' + name, __package__)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in TOOLS:
+        return _module(TOOLS[argv[0]]).main(argv[1:])
+
+    parser = argparse.ArgumentParser(
+        prog='python -m v2',
+        description='Run computational bacteria scenarios (tools: %s)'
+                    % ', '.join(sorted(TOOLS)))
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('scenarios', help='list the scenarios')
+    run = commands.add_parser('run', help='run a scenario')
+    run.add_argument('name')
+    run.add_argument('--set', action='append', default=[],
+                     metavar='NAME=VALUE', help='scenario parameter')
+    run.add_argument('--until', type=float, default=None)
+    run.add_argument('--seed', type=int, default=None)
+    play = commands.add_parser('play', help='run a scenario file')
+    play.add_argument('path')
+    play.add_argument('--until', type=float, default=None)
+    play.add_argument('--fast-forward', action='store_true',
+                      help='jump over steady states (analytic spaces)')
+    demo = commands.add_parser('demo', help='run a demo script')
+    demo.add_argument('name', choices=sorted(DEMOS))
+    args = parser.parse_args(argv)
+
+    if args.command == 'scenarios':
+        for name in sorted(_module('cb_sweep').SCENARIOS):
+            print(name)
+    elif args.command == 'run':
+        sweep = _module('cb_sweep')
+        if args.name not in sweep.SCENARIOS:
+            parser.error('unknown scenario %s (try: python -m v2 scenarios)'
+                         % args.name)
+        params = {}
+        for setting in args.set:
+            name, _, value = setting.partition('=')
+            params[name] = sweep._parse_value(value)
+        if args.until is not None:
+            params['until'] = args.until
+        #the seed of the first point of a sweep with that base seed
+        seed = sweep.run_seed(args.seed if args.seed is not None
+                              else sweep.RANDOM_SEED, 0)
+        record = sweep.run_point(sweep.SCENARIOS[args.name], 0, params,
+                                 seed)
+        print(json.dumps(record._asdict()))
+    elif args.command == 'play':
+        import simpy
+        env = simpy.Environment()
+        scheduler = forward = None
+        if args.fast_forward:
+            scheduler = _module('cb_scheduler').TickScheduler(env)
+        recorder = _module('cb_recorder').TemperatureRecorder()
+        facility = _module('cb_scenario').load_facility(env, args.path,
+                                                        scheduler, recorder)
+        until = args.until if args.until is not None else facility.until
+        if args.fast_forward:
+            forward = _module('cb_fastforward').FastForward(
+                env, facility.rooms.values(), scheduler, facility.driver,
+                facility.event_queue, until=until)
+        env.run(until=until)
+        results = facility.results()
+        results['readings'] = len(recorder)
+        if forward is not None:
+            results['skipped_time'] = forward.skipped_time()
+            results['skipped_wake_ups'] = forward.skipped_wake_ups()
+        print(json.dumps(results))
+    elif args.command == 'demo':
+        _module(DEMOS[args.name]).main()
+    else:
+        parser.print_help()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,14 @@
+import time
+
 import simpy
 
+from .cb_event import event_key
+from .cb_eventbus import EventBus
+from .cb_instrument import event_latency
+from .cb_trace import get_tracer
+
+_trace = get_tracer('bacterium')
+
 #TO DO:
 # - make Cb's discoverable somehow
 class CbBase(object):
@@ -12,8 +21,28 @@ class CbBase(object):
     A bacterium reacts to events. An event interrupts
     and pre-empt its other on-going activity (in this case sleeping).
 
+    Purely reactive bacteria, which have no sustenance work to do,
+    declare reactive = True. They run without the periodic acting process
+    and handle their events as soon as they pick them up, so they cost
+    nothing while idle.
+
+    With a scheduler (a cb_scheduler.TickScheduler) the periodic activity
+    is driven by the scheduler, which wakes all bacteria due at the same
+    time from one timer, instead of by an acting process of its own.
+
+    Setting instrumentation (on the class for all bacteria, or on an
+    instance) to a cb_instrument.Instrumentation counts wake-ups,
+    interrupts, time spent in the activities and event latency. Likewise a
+    trace_recorder (a cb_replay.TraceRecorder) writes every handled event
+    to a trace.
+
     """
-    def __init__(self, env, id, context, event_stream, event_kinds, period):
+    instrumentation = None
+    trace_recorder = None
+    reactive = False
+
+    def __init__(self, env, id, context, event_stream, event_kinds, period,
+                 scheduler=None):
         self.env = env
         self.id = id
         self.ev_kinds = event_kinds
@@ -21,11 +50,24 @@ class CbBase(object):
         self.events = event_stream
         self.event = None
         self.period = period
+        self.scheduler = scheduler
+        #the sleep in progress, kept on the instance for checkpoints
+        self.sleep_starts_at = env.now
+        self.sleep_time_left = period
+        if isinstance(event_stream, EventBus):
+            #receive broadcasts of our kinds even while busy
+            event_stream.subscribe(event_kinds, id)
 
         self.init_cb_process();
 
     def init_cb_process(self):
-        self.acting_process = self.env.process(self.acting())
+        if self.reactive:
+            self.acting_process = None  # event-only mode, no timer
+        elif self.scheduler is not None:
+            self.acting_process = None  # woken up by the scheduler
+            self.scheduler.add(self)
+        else:
+            self.acting_process = self.env.process(self.acting())
         self.listening_process = self.env.process(self.listening())
 
 
@@ -35,30 +77,70 @@ class CbBase(object):
             Sleep for the period and wake up to do the work.
             If interrupted, process the event that caused the interrupt.
         """
-        sleep_time_left = self.period
         while True:
             try:
                 #sleep for period
-                sleep_starts_at = self.env.now
-                yield self.env.timeout(sleep_time_left)
+                self.sleep_starts_at = self.env.now
+                yield self.env.timeout(self.sleep_time_left)
                 #act
-                self.sustenance_activity()
-                sleep_time_left = self.period
+                self.sustain()
+                self.sleep_time_left = self.period
             except simpy.Interrupt:
                 # handle event
-                self.on_interrupt_activity()
-                #clear the processed event
-                self.event = None
-                sleep_time_left = self.period - (self.env.now-sleep_starts_at)
-                print('sleep_time_left %d' % sleep_time_left)
+                self.handle_event()
+                self.sleep_time_left = (self.period -
+                                        (self.env.now-self.sleep_starts_at))
+                _trace.debug('sleep_time_left %d', self.sleep_time_left)
+
+
+    def remaining_sleep(self):
+        """Time until the next sustenance activity (None if reactive)"""
+        if self.reactive:
+            return None
+        return self.sleep_time_left - (self.env.now - self.sleep_starts_at)
 
+    def sustain(self):
+        """Perform the sustenance activity, instrumented if requested"""
+        if self.instrumentation is None:
+            self.sustenance_activity()
+        else:
+            started = time.perf_counter()
+            self.sustenance_activity()
+            self.instrumentation.wake_up(self, time.perf_counter() - started)
+
+    def handle_event(self):
+        """Process the current event, instrumented if requested, and
+        clear it"""
+        if self.trace_recorder is not None:
+            self.trace_recorder.interrupt(self.env.now, self.id, self.event)
+        if self.instrumentation is None:
+            self.on_interrupt_activity()
+        else:
+            started = time.perf_counter()
+            self.on_interrupt_activity()
+            self.instrumentation.interrupt(self, time.perf_counter() - started,
+                                           event_latency(self.env, self.event))
+        #clear the processed event
+        self.event = None
 
     def listening(self):
         """Pick up interesting events and interrupt basic activity"""
-        filter = lambda event: ((event[1] is None or event[1] == self.id)
-                                and (event[0] in self.ev_kinds))
+        if isinstance(self.events, EventBus):
+            #indexed lookup by (kind, id), no filter to run
+            request = lambda: self.events.get(self.ev_kinds, self.id)
+        else:
+            def filter(event):
+                kind, target = event_key(event)
+                return ((target is None or target == self.id)
+                        and (kind in self.ev_kinds))
+            request = lambda: self.events.get(filter)
         while True:
-            self.event = yield self.events.get(filter)
-            #interrupt the duty cycle to process the event
-            self.acting_process.interrupt()
+            self.event = yield request()
+            if self.acting_process is None:
+                self.handle_event()
+                if self.scheduler is not None and not self.reactive:
+                    self.scheduler.interrupted(self)
+            else:
+                #interrupt the duty cycle to process the event
+                self.acting_process.interrupt()
             
@@ -0,0 +1,231 @@
+"""
+Throughput benchmarks for colonies of computational bacteria
+
+Each benchmark builds a colony of CbHeater and CbThermometer bacteria in
+ContainingSpace rooms on an EventBus, plus a MessageDispatcher with a set
+of receivers, and runs it for a fixed simulated time. Starting from a base
+configuration, one axis at a time is scaled:
+
+- bacteria: number of heaters and thermometers
+- event_rate: heat_on/heat_off events put per simulated second
+- backlog: events queued up front for receivers that do not exist
+- rooms: number of ContainingSpace instances
+- receivers: number of MessageDispatcher receivers (one broadcast per
+  simulated second)
+
+For every configuration the benchmark reports the number of events
+dispatched (every event the bus handed on, EventBus.dispatched: heater
+events, thermometer readings, the backlog and each copy of a broadcast,
+plus the messages delivered), events per wall-clock second, wall time per
+simulated second and peak memory (in a second run under tracemalloc).
+With --pool the readings of the thermometers are recycled through an
+EventPool.
+
+Results are written as JSON. With --baseline, they are compared to a
+stored result file: configurations whose wall time per simulated second
+or peak memory grew, or whose events per second fell, by more than the
+tolerance are listed; the exit status is 1 if there are any.
+
+    python -m v2.cb_bench --out bench.json
+    python -m v2.cb_bench --quick --baseline bench.json
+
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import simpy
+
+from .cb_containingspace import ContainingSpace
+from .cb_event import Event, EventPool
+from .cb_eventbus import EventBus
+from .cb_heater import CbHeater
+from .cb_thermometer import CbThermometer
+
+from messaging import Message, MessageDispatcher
+
+RANDOM_SEED = 42
+SIM_TIME = 1000  # seconds
+
+BASE = dict(bacteria=100, event_rate=1, backlog=0, rooms=1, receivers=10)
+AXES = dict(bacteria=[100, 1000, 5000],
+            event_rate=[1, 10, 100],
+            backlog=[0, 1000, 10000],
+            rooms=[1, 100, 1000],
+            receivers=[10, 100, 1000])
+QUICK_AXES = dict(bacteria=[100, 1000],
+                  event_rate=[1, 10],
+                  backlog=[0, 1000],
+                  rooms=[1, 100],
+                  receivers=[10, 100])
+#measurements compared to the baseline, and whether lower is better
+COMPARED = (('wall_per_sim_sec', True), ('peak_memory', True),
+            ('events_per_sec', False))
+
+
+class _Receiver(object):
+    """Minimal MessageDispatcher receiver"""
+
+    def __init__(self, counter):
+        self.counter = counter
+
+    def receive(self, message):
+        self.counter[0] += 1
+
+
+def build_colony(env, bacteria, event_rate, backlog, rooms, receivers,
+                 seed=RANDOM_SEED):
+    """Set up a benchmark colony in env and return a function giving the
+    number of events dispatched so far"""
+    rng = random.Random(seed)
+    delivered = [0]  # messages
+    event_queue = EventBus(env, broadcast_kinds=['ping'])
+    spaces = [ContainingSpace(env, 288, 290, 5*5*3) for _ in range(rooms)]
+    heaters = []
+    for i in range(bacteria):
+        room = spaces[i % rooms]
+        if i % 2 == 0:
+            heater = CbHeater(env, 'heater%d' % i, room, event_queue,
+                              ['ping', 'heat_on', 'heat_off'], 60, 100)
+            room.add_heat_source(heater)
+            heaters.append(heater)
+        else:
+            CbThermometer(env, 'thermometer%d' % i, room, event_queue,
+                          ['ping'], 20)
+    for i in range(backlog):
+        event_queue.put(Event('heat_on', 'ghost%d' % i, env.now))
+
+    def event_generator():
+        while True:
+            yield env.timeout(1 / event_rate)
+            if heaters:
+                heater = rng.choice(heaters)
+                kind = 'heat_off' if heater.heat_on else 'heat_on'
+                yield event_queue.put(Event(kind, heater.id, env.now))
+
+    def temp_listener():
+        while True:
+            event = yield event_queue.get(['temp_measurement'])
+            if CbThermometer.event_pool is not None:
+                CbThermometer.event_pool.release(event)
+
+    dispatcher = MessageDispatcher()
+    #the dispatcher only holds weak references to its receivers
+    receiver_list = [_Receiver(delivered) for _ in range(receivers)]
+    for receiver in receiver_list:
+        dispatcher.register(receiver)
+
+    def message_generator(receivers):
+        while True:
+            yield env.timeout(1)
+            dispatcher.broadcast(Message(None))
+
+    env.process(event_generator())
+    env.process(temp_listener())
+    env.process(message_generator(receiver_list))
+    return lambda: sum(event_queue.dispatched.values()) + delivered[0]
+
+
+def run_benchmark(config, sim_time=SIM_TIME, memory=True):
+    """Run one configuration and return its measurements"""
+    env = simpy.Environment()
+    dispatched = build_colony(env, **config)
+    started = time.perf_counter()
+    env.run(until=sim_time)
+    wall_time = time.perf_counter() - started
+    events = dispatched()
+    result = dict(config=config,
+                  sim_time=sim_time,
+                  events=events,
+                  wall_time=wall_time,
+                  events_per_sec=events / wall_time,
+                  wall_per_sim_sec=wall_time / sim_time,
+                  peak_memory=None)
+    if memory:
+        tracemalloc.start()
+        env = simpy.Environment()
+        build_colony(env, **config)
+        env.run(until=sim_time)
+        result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def configurations(axes):
+    """Name and configuration of each benchmark: the base configuration
+    with one axis changed at a time"""
+    for axis in sorted(axes):
+        for value in axes[axis]:
+            config = dict(BASE)
+            config[axis] = value
+            yield '%s=%s' % (axis, value), config
+
+
+def compare(results, baseline, tolerance):
+    """Names of the benchmarks with a measurement worse by more than
+    tolerance (a fraction) than in baseline, with that measurement"""
+    worse = []
+    for name, result in sorted(results.items()):
+        if name not in baseline:
+            continue
+        for measurement, lower_is_better in COMPARED:
+            value = result.get(measurement)
+            reference = baseline[name].get(measurement)
+            if not value or not reference:
+                continue  # not measured in one of the runs
+            ratio = value / reference
+            print('%-20s %-16s %6.2fx baseline' % (name, measurement, ratio),
+                  file=sys.stderr)
+            if lower_is_better and ratio > 1 + tolerance or \
+                    not lower_is_better and ratio < 1 / (1 + tolerance):
+                worse.append('%s (%s)' % (name, measurement))
+    return worse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Colony scaling benchmarks')
+    parser.add_argument('--quick', action='store_true',
+                        help='smaller configurations')
+    parser.add_argument('--sim-time', type=float, default=SIM_TIME)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the peak memory runs')
+    parser.add_argument('--out', default=None,
+                        help='JSON result file (default: stdout)')
+    parser.add_argument('--baseline', default=None,
+                        help='JSON result file to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--pool', action='store_true',
+                        help='recycle thermometer readings (EventPool)')
+    args = parser.parse_args(argv)
+    if args.pool:
+        CbThermometer.event_pool = EventPool()
+
+    results = {}
+    for name, config in configurations(QUICK_AXES if args.quick else AXES):
+        results[name] = run_benchmark(config, args.sim_time,
+                                      not args.no_memory)
+        print('%-20s %10.0f events/s %10.6f wall s/sim s' %
+              (name, results[name]['events_per_sec'],
+               results[name]['wall_per_sim_sec']), file=sys.stderr)
+    output = json.dumps(results, indent=1, sort_keys=True)
+    if args.out:
+        with open(args.out, 'w') as out:
+            out.write(output + '\n')
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as stored:
+            worse = compare(results, json.load(stored), args.tolerance)
+        if worse:
+            print('worse than baseline: %s' % ', '.join(worse),
+                  file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""
+Checkpoint and restore of a running simulation
+
+snapshot() captures the state of a colony at env.now:
+
+- spaces (ContainingSpace, AnalyticContainingSpace): temperature brought
+  up to date to env.now, heat sources, and the time left in the running
+  update cycle
+- bacteria (CbHeater, CbThermometer): the time left until their next
+  sustenance activity, heat_on/output of heaters, the last reading of
+  thermometers, and an event that was picked up but not handled yet
+- the events queued in an EventBus, with the time they have left to
+  live, and the capacities, policies and times to live set on it
+
+save() writes it to a gzipped JSON file, and restore() rebuilds the colony
+in a fresh simpy.Environment starting at the checkpoint time, so what-if
+runs can continue from a warmed-up state:
+
+    checkpoint.save('warm.ckpt', checkpoint.snapshot(env, rooms, bacteria,
+                                                     event_queue))
+    ...
+    env, rooms, bacteria, event_queue = checkpoint.restore(
+        checkpoint.load('warm.ckpt'))
+
+Processes that are not part of the colony (event generators, listeners)
+are not captured; they are started again in the restored environment.
+Events must be cb_event.Event objects or tuples holding JSON values
+(strings, numbers, None). Puts waiting for room under BLOCK, dead letters
+and the bus counters are not captured either, and a kind bounded with a
+source_key function of its own comes back with the default one: call
+set_capacity() again on the restored bus to use it.
+
+"""
+
+import gzip
+import json
+
+import simpy
+
+from .cb_containingspace import (ContainingSpace, AnalyticContainingSpace,
+                                heat_output_of)
+from .cb_event import Event
+from .cb_eventbus import EventBus
+from .cb_heater import CbHeater
+from .cb_thermometer import CbThermometer
+
+FORMAT_VERSION = 1
+
+SPACE_CLASSES = {
+    'ContainingSpace': ContainingSpace,
+    'AnalyticContainingSpace': AnalyticContainingSpace,
+}
+BACTERIUM_CLASSES = {
+    'CbHeater': CbHeater,
+    'CbThermometer': CbThermometer,
+}
+
+
+def snapshot(env, spaces, bacteria, event_stream=None):
+    """Return the state of spaces, bacteria and event_stream (an EventBus)
+    at env.now as a dict of plain values"""
+    space_index = dict((id(space), i) for i, space in enumerate(spaces))
+    state = {'version': FORMAT_VERSION, 'now': env.now,
+             'spaces': [], 'bacteria': [], 'events': None}
+    for space in spaces:
+        kind = _class_name(space, SPACE_CLASSES)
+        space_state = {'class': kind,
+                       'low_eq': space.low_equilibrium,
+                       'volume': space.volume,
+                       'temperature': space.current_temperature()}
+        if kind == 'ContainingSpace':
+            space_state['coalesce_interrupts'] = space.coalesce_interrupts
+            space_state['next_update'] = space.next_update()
+        state['spaces'].append(space_state)
+    for cb in bacteria:
+        kind = _class_name(cb, BACTERIUM_CLASSES)
+        cb_state = {'class': kind,
+                    'id': cb.id,
+                    'event_kinds': list(cb.ev_kinds),
+                    'period': cb.period,
+                    'context': space_index.get(id(cb.context)),
+                    'sleep_time_left': cb.remaining_sleep(),
+                    'event': (_event_state(cb.event)
+                              if cb.event is not None else None)}
+        if kind == 'CbHeater':
+            cb_state['output'] = cb.heat_output
+            cb_state['heat_on'] = cb.heat_on
+            cb_state['source_of'] = [i for i, space in enumerate(spaces)
+                                     if cb in space.heat_sources]
+        elif kind == 'CbThermometer':
+            cb_state['last_temp_read'] = cb.last_temp_read
+        state['bacteria'].append(cb_state)
+    if event_stream is not None:
+        state['events'] = dict(
+            event_stream.settings(),
+            broadcast_kinds=sorted(event_stream.broadcast_kinds),
+            #target, event, time left to live
+            queued=[[target, _event_state(event),
+                     None if expires_at is None else expires_at - env.now]
+                    for target, event, expires_at in
+                    event_stream.queued(expiry=True)])
+    return state
+
+
+def restore(state, env=None):
+    """Rebuild a colony from a snapshot. Returns (env, spaces, bacteria,
+    event_stream); env is a new environment starting at the checkpoint
+    time unless one is given."""
+    if state.get('version') != FORMAT_VERSION:
+        raise ValueError('restore(): unsupported checkpoint version %s'
+                         % state.get('version'))
+    if env is None:
+        env = simpy.Environment(initial_time=state['now'])
+    event_stream = None
+    if state['events'] is not None:
+        event_stream = EventBus(env, state['events']['broadcast_kinds'])
+        for kind, (capacity, policy, max_waiting) in \
+                state['events'].get('capacities', {}).items():
+            event_stream.set_capacity(kind, capacity, policy,
+                                      max_waiting=max_waiting)
+        for kind, ttl in state['events'].get('ttls', {}).items():
+            event_stream.set_ttl(kind, ttl)
+    spaces = []
+    for space_state in state['spaces']:
+        cls = SPACE_CLASSES[space_state['class']]
+        if cls is ContainingSpace:
+            space = cls(env, space_state['low_eq'],
+                        space_state['temperature'], space_state['volume'],
+                        coalesce_interrupts=space_state['coalesce_interrupts'],
+                        next_update=space_state['next_update'])
+        else:
+            space = cls(env, space_state['low_eq'],
+                        space_state['temperature'], space_state['volume'])
+        spaces.append(space)
+    bacteria = []
+    for cb_state in state['bacteria']:
+        cls = BACTERIUM_CLASSES[cb_state['class']]
+        context = (spaces[cb_state['context']]
+                   if cb_state['context'] is not None else None)
+        args = (env, cb_state['id'], context, event_stream,
+                cb_state['event_kinds'], cb_state['period'])
+        if cls is CbHeater:
+            cb = cls(*args, output=cb_state['output'],
+                     heat_on=cb_state['heat_on'])
+            for i in cb_state['source_of']:
+                _attach_source(spaces[i], cb)
+        else:
+            cb = cls(*args)
+            cb.last_temp_read = cb_state['last_temp_read']
+        #processes have not started yet: the first sleep is the rest of
+        #the one in progress at the checkpoint
+        if cb_state['sleep_time_left'] is not None:
+            cb.sleep_time_left = cb_state['sleep_time_left']
+        bacteria.append(cb)
+    if event_stream is not None:
+        for cb_state in state['bacteria']:
+            if cb_state['event'] is not None:
+                #picked up but not handled: hand it to the bacterium again
+                event_stream.deliver(_event_from_state(cb_state['event']),
+                                     cb_state['id'])
+        for queued in state['events']['queued']:
+            target, event = queued[:2]
+            ttl = queued[2] if len(queued) > 2 else None
+            event_stream.deliver(_event_from_state(event), target, ttl)
+    return env, spaces, bacteria, event_stream
+
+
+def save(path, state):
+    with gzip.open(path, 'wt') as out:
+        json.dump(state, out, separators=(',', ':'))
+
+
+def load(path):
+    with gzip.open(path, 'rt') as stored:
+        return json.load(stored)
+
+
+def _class_name(obj, classes): #private
+    name = type(obj).__name__
+    if name not in classes:
+        raise ValueError('snapshot(): cannot checkpoint %s objects' % name)
+    return name
+
+
+def _event_state(event): #private
+    if isinstance(event, Event):
+        return {'fields': list(event.fields())}
+    return list(event)
+
+
+def _event_from_state(event_state): #private
+    if isinstance(event_state, dict):
+        return Event(*event_state['fields'])
+    return tuple(event_state)
+
+
+def _attach_source(space, heater): #private
+    """Add heater to the sources of space without notifying its duty
+    cycle (the restored temperature already accounts for it)"""
+    space._set_contribution(heater, heat_output_of(heater))
+    heater.set_listener_callback(space.heat_source_output_changed)
+    if isinstance(space, AnalyticContainingSpace):
+        space.sources_changed()
@@ -16,22 +16,68 @@ of the space (target equilibrium temp is lower than actual current temp).
 
 import simpy
 
+from .cb_trace import get_tracer
+
 UPDATE_FREQ = 2 # times per minute
 SIM_TIME = 2000  # seconds (10 minutes)
 
-class ContainingSpace(object):
+_trace = get_tracer('space')
 
-        def __init__(self,env,low_eq,start_temp,volume):
+class HeatSourceTotal(object):
+        """Heat output of the sources of a space: heat_sources maps each
+        source (by identity) to the output it contributes, total_output is
+        their running total"""
+
+        def current_heat_from_sources(self): #private
+            #running total kept up to date by add/remove/changed
+            total_output = self.total_output
+            if total_output is None or total_output < 0:
+                total_output = 0
+            return total_output
+
+        def _set_contribution(self,heat_source,output): #private
+            """Record output as the contribution of heat_source (None to
+            drop it) and update the running total"""
+            self.total_output -= self.heat_sources.pop(heat_source,0)
+            if output is not None:
+                self.heat_sources[heat_source] = output
+                self.total_output += output
+            if not self.heat_sources:
+                self.total_output = 0  # no rounding leftovers
+
+
+class ContainingSpace(HeatSourceTotal):
+        """A space warmed up by heat sources, its temperature updated
+        periodically.
+
+        With a trace_recorder (a cb_replay.TraceRecorder) set, heat sources
+        added and removed and changes of their output are written to its
+        trace.
+        """
+        trace_recorder = None
+
+        def __init__(self,env,low_eq,start_temp,volume,
+                     coalesce_interrupts=False,next_update=None):
             self.env = env
             self.low_equilibrium = low_eq  # Kelvin
             self.temperature = start_temp  # Kelvin
             self.volume = volume           # cubic meter
-            self.heat_sources = []
+            #heat output each source contributes, keyed by the source itself
+            #(identity), and their running total
+            self.heat_sources = {}
+            self.total_output = 0
+            #with coalescing, all source changes at one timestamp cause a
+            #single interrupt and recompute
+            self.coalesce_interrupts = coalesce_interrupts
+            self.interrupt_pending = False
+            self.coalesced_interrupts = 0  # changes merged into another one
+            self.cycle_start_time = None   # of the current cycle
+            self.time_to_next_update = next_update or (1 / UPDATE_FREQ) * 60
             self.duty_process = env.process(
-                self.update((1 / UPDATE_FREQ) * 60)
+                self.update((1 / UPDATE_FREQ) * 60,next_update)
             ) 
 
-        def update(self,cycle_length): #private
+        def update(self,cycle_length,first_cycle=None): #private
             """The duty cycle: wait for set time, then compute new temperature
             based on heat output level from heat sources during the time passed
 
@@ -40,46 +86,73 @@ class ContainingSpace(object):
             heat output until the interrupt. A new cycle is started with the
             time remaining from the previous cycle to keep the update period
             constant.
+
+            The first cycle can be shorter (first_cycle) to continue the
+            update schedule of a restored checkpoint.
             """
-            print('At %s: start of first cycle, temperature: %1.f' %
-                  (self.env.now,self.temperature))
-            time_to_next_update = cycle_length
+            _trace.info('At %s: start of first cycle, temperature: %1.f',
+                        self.env.now,self.temperature)
+            time_to_next_update = first_cycle or cycle_length
             while True:
                 try:
-                    cycle_start_time = self.env.now
-                    print('@Cycle starts at: %s' % cycle_start_time)
+                    self.cycle_start_time = self.env.now
+                    _trace.debug('@Cycle starts at: %s', self.cycle_start_time)
                     #record heat ouput and target equilibriums for computing
                     #temperature at the end of this cycle
-                    heat_output_at_start = self.current_heat_from_sources()
-                    equilibriums_at_start = self.compute_equilibriums()
-                    print('Output is %d at: %s' %(heat_output_at_start,cycle_start_time))
+                    self.heat_output_at_start = self.current_heat_from_sources()
+                    self.equilibriums_at_start = self.compute_equilibriums()
+                    _trace.debug('Output is %d at: %s',
+                                 self.heat_output_at_start,self.cycle_start_time)
+                    self.time_to_next_update = time_to_next_update
                     yield self.env.timeout(time_to_next_update)
-                    time_passed = self.env.now - cycle_start_time
+                    time_passed = self.env.now - self.cycle_start_time
                     self.compute_and_set_temperature(
-                        equilibriums_at_start,
+                        self.equilibriums_at_start,
                         self.cooling_gradient(time_passed),
-                        self.warming_gradient(time_passed,heat_output_at_start))
-                    print('At %s: temperature is %.1f K' %
-                          (self.env.now,self.temperature))
+                        self.warming_gradient(time_passed,self.heat_output_at_start))
+                    _trace.debug('At %s: temperature is %.1f K',
+                                 self.env.now,self.temperature)
                     time_to_next_update = cycle_length
                 except simpy.Interrupt:
-                    print('Cycle interrupted at %s' % self.env.now)
+                    _trace.debug('Cycle interrupted at %s', self.env.now)
+                    self.interrupt_pending = False
                     #calculate and set temperature based on time passed
                     #until now, heat output at the start of this cycle, and
                     #the target equilibriums at the start of this cycle
-                    time_passed = self.env.now - cycle_start_time
+                    time_passed = self.env.now - self.cycle_start_time
                     self.compute_and_set_temperature(
-                        equilibriums_at_start,
+                        self.equilibriums_at_start,
                         self.cooling_gradient(time_passed),
-                        self.warming_gradient(time_passed,heat_output_at_start))
-                    print('At %s: temperature is %.1f K' %
-                          (self.env.now,self.temperature))
+                        self.warming_gradient(time_passed,self.heat_output_at_start))
+                    _trace.debug('At %s: temperature is %.1f K',
+                                 self.env.now,self.temperature)
                     #the length of the next cycle needs to be adjusted by
                     #subtracting the time passed to keep update frequency constant
                     time_to_next_update = cycle_length - time_passed
 
+        def current_temperature(self):
+            """Temperature at env.now including the change since the start
+            of the running cycle (temperature is only set at cycle ends)"""
+            if self.cycle_start_time is None:
+                return self.temperature
+            saved = self.temperature
+            time_passed = self.env.now - self.cycle_start_time
+            self.compute_and_set_temperature(
+                self.equilibriums_at_start,
+                self.cooling_gradient(time_passed),
+                self.warming_gradient(time_passed,self.heat_output_at_start))
+            current, self.temperature = self.temperature, saved
+            return current
+
+        def next_update(self):
+            """Time left until the end of the running cycle"""
+            if self.cycle_start_time is None:
+                return self.time_to_next_update
+            return self.time_to_next_update - (self.env.now -
+                                               self.cycle_start_time)
+
         def compute_and_set_temperature(self,eq_target,cooling_gradient,warming_gradient): #private
-            print('Equilibrium target: %.1f' % eq_target[1])
+            _trace.debug('Equilibrium target: %.1f', eq_target[1])
             gradient = 0.0 # delta temperature
             #if the current temperature is higher than the target temp, need
             #to apply the cooling gradient (constant)
@@ -100,13 +173,6 @@ class ContainingSpace(object):
             if self.temperature < eq_target[0]: #...just to be sure we don't go
                 self.temperature = eq_target[0] #below lowest possible temp. 
 
-        def current_heat_from_sources(self): #private
-            #total_output = sum(s.heat_output for s in self.heat_sources)
-            total_output = sum(s.heat_output for s in self.heat_sources if s.heat_on)
-            if total_output is None or total_output < 0:
-                total_output = 0
-            return total_output
-        
         def compute_equilibriums(self): #private
             """Computation of the target temperature is based on the heat output 
             of the active sources and on the volume of the space. The lower
@@ -128,37 +194,157 @@ class ContainingSpace(object):
                 #keep cooling down
                 return -self.cooling_gradient(time_span) 
             else:
-                print('Warming gradient: %.3f for time span: %s' %
-                      ((time_span / 60 * (total_output / 100 * 0.1)),time_span))
-                return (time_span / 60 * (total_output / 100 * 0.1))
+                gradient = time_span / 60 * (total_output / 100 * 0.1)
+                _trace.debug('Warming gradient: %.3f for time span: %s',
+                             gradient,time_span)
+                return gradient
             
         def add_heat_source(self,heat_source):
             """Add heat_source to active sources"""
             if not heat_source in self.heat_sources:
-                self.heat_sources.append(heat_source)
+                self._set_contribution(heat_source,heat_output_of(heat_source))
+                if self.trace_recorder is not None:
+                    self.trace_recorder.source_added(self,heat_source)
                 heat_source.set_listener_callback(self.heat_source_output_changed)
-                print('++ Added source %s with output %d' %
-                      (heat_source.id,heat_source.heat_output))
-                self.duty_process.interrupt()
+                _trace.info('++ Added source %s with output %d',
+                            heat_source.id,heat_source.heat_output)
+                self.sources_changed()
 
         def remove_heat_source(self,heat_source):
             """Remove heat_source from active sources"""
             if heat_source in self.heat_sources:
-                self.heat_sources.remove(heat_source)
+                self._set_contribution(heat_source,None)
+                if self.trace_recorder is not None:
+                    self.trace_recorder.source_removed(self,heat_source)
                 heat_source.set_listener_callback(None)
-                print('-- Removed source %s with output %d' %
-                      (heat_source.id,heat_source.heat_output))
-                self.duty_process.interrupt()
+                _trace.info('-- Removed source %s with output %d',
+                            heat_source.id,heat_source.heat_output)
+                self.sources_changed()
 
         def heat_source_output_changed(self,heat_source):
             """React to change in output of heat_source"""
             if heat_source in self.heat_sources:
+                self._set_contribution(heat_source,heat_output_of(heat_source))
+                if self.trace_recorder is not None:
+                    self.trace_recorder.source_output(self,heat_source)
                 if heat_source.heat_on:
-                    print('** Source %s changed output to %d' %
-                            (heat_source.id,heat_source.heat_output))
+                    _trace.info('** Source %s changed output to %d',
+                                heat_source.id,heat_source.heat_output)
                 else:
-                    print('** Source %s changed output to 0' % (heat_source.id))
-                self.duty_process.interrupt()
+                    _trace.info('** Source %s changed output to 0',
+                                heat_source.id)
+                self.sources_changed()
+
+        def sources_changed(self): #private
+            """Bring the temperature up to date and restart the cycle with
+            the new heat output"""
+            if self.coalesce_interrupts:
+                if self.interrupt_pending or self.cycle_start_time is None:
+                    #the pending interrupt (or the first cycle, not started
+                    #yet) will pick up this change as well
+                    self.coalesced_interrupts += 1
+                    return
+                if self.cycle_start_time == self.env.now:
+                    #the cycle restarted at this very moment, no time has
+                    #passed: only the output recorded at its start is stale
+                    self.heat_output_at_start = self.current_heat_from_sources()
+                    self.equilibriums_at_start = self.compute_equilibriums()
+                    self.coalesced_interrupts += 1
+                    return
+                self.interrupt_pending = True
+            self.duty_process.interrupt()
+
+
+def heat_output_of(heat_source):
+    """Heat output heat_source currently contributes to a space"""
+    return heat_source.heat_output if heat_source.heat_on else 0
+
+
+class AnalyticModel(object):
+        """Closed-form temperature model, mixed into a space class in front
+        of its periodic base (ContainingSpace here, ContainedSpace in the
+        prototype), whose equilibrium and gradient methods it uses.
+
+        Between heat source changes the temperature moves linearly towards
+        the target equilibrium and then stays there, so only the last
+        breakpoint (time and temperature), the current slope and the target
+        are stored. temperature is computed from them for the current
+        env.now. A change of the heat sources starts a new segment, and a
+        single wake-up is scheduled for the moment the target is reached to
+        start a flat segment there. No periodic process runs and nothing is
+        interrupted.
+
+        A start temperature below the low equilibrium is raised to it
+        right away (the periodic model does so at the end of its first
+        cycle).
+        """
+
+        def _start_model(self,start_temp): #private
+            self._segment = 0  # bumped on every new segment
+            self._start_segment(max(start_temp,self.low_equilibrium))
+
+        @property
+        def temperature(self):
+            temperature = self._temp0 + self._slope * (self.env.now - self._t0)
+            if self._slope > 0:
+                return min(temperature,self._target)
+            elif self._slope < 0:
+                return max(temperature,self._target)
+            return temperature
+
+        @temperature.setter
+        def temperature(self,value):
+            self._start_segment(value)
+
+        def current_temperature(self):
+            return self.temperature
+
+        def sources_changed(self): #private
+            self._start_segment(self.temperature)
+
+        def steady(self):
+            """True while the temperature stays where it is"""
+            return self._slope == 0
+
+        def _start_segment(self,temperature): #private
+            """Start a new linear segment at env.now from temperature"""
+            self._segment += 1
+            self._t0 = self.env.now
+            self._temp0 = temperature
+            self._target = self.compute_equilibriums()[1]
+            #gradients per second of the periodic model
+            if temperature > self._target:
+                self._slope = -self.cooling_gradient(1)
+            elif temperature < self._target:
+                self._slope = self.warming_gradient(1,
+                                                    self.current_heat_from_sources())
+            else:
+                self._slope = 0.0
+            _trace.debug('At %s: temperature %.1f K, slope %.5f K/s to %.1f K',
+                         self._t0,temperature,self._slope,self._target)
+            if self._slope:
+                wake_up = self.env.timeout(
+                    (self._target - temperature) / self._slope)
+                segment = self._segment
+                wake_up.callbacks.append(
+                    lambda event: self._reach_target(segment))
+
+        def _reach_target(self,segment): #private
+            #ignore wake-ups of segments superseded by a source change
+            if segment == self._segment:
+                self._start_segment(self._target)
+
+
+class AnalyticContainingSpace(AnalyticModel,ContainingSpace):
+        """Closed-form variant of ContainingSpace (see AnalyticModel)"""
+
+        def __init__(self,env,low_eq,start_temp,volume):
+            self.env = env
+            self.low_equilibrium = low_eq  # Kelvin
+            self.volume = volume           # cubic meter
+            self.heat_sources = {}
+            self.total_output = 0
+            self._start_model(start_temp)
 
 
 ##class HeatSource(object):
@@ -176,11 +362,11 @@ class ContainingSpace(object):
 ##    for action in actions:
 ##        yield env.timeout(action[0])
 ##        print('>> Heat source action %s' % action[1])
-##        if action[1] is 'add':
+##        if action[1] == 'add':
 ##            space.add_heat_source(action[2])
-##        elif action[1] is 'remove':
+##        elif action[1] == 'remove':
 ##            space.remove_heat_source(action[2])
-##        elif action[1] is 'change':
+##        elif action[1] == 'change':
 ##            action[2].output = action[3]
 ##            space.heat_source_output_changed(action[2])
 ##        else:
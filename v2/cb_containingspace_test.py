@@ -1,8 +1,11 @@
-from cb_heater import CbHeater
-from cb_thermometer import CbThermometer
-from cb_containingspace import ContainingSpace
+from .cb_heater import CbHeater
+from .cb_thermometer import CbThermometer
+from .cb_containingspace import ContainingSpace, AnalyticContainingSpace
+from .cb_event import Event
+from .cb_eventbus import EventBus
 
 import simpy
+from . import cb_trace
 
 SIM_TIME = 1000  # seconds (10 minutes)
     
@@ -13,18 +16,19 @@ def heat_source_activity(env,space,event_queue,actions):
     for action in actions:
         yield env.timeout(action[0])
         print('>> Heat source action %s' % action[1])
-        if action[1] is 'add':
+        if action[1] == 'add':
             #action[2].heat_on = True
             space.add_heat_source(action[2])
-            yield event_queue.put(('heat_on',action[2].id,env.now))
-        elif action[1] is 'remove':
+            yield event_queue.put(Event('heat_on',action[2].id,env.now))
+        elif action[1] == 'remove':
             space.remove_heat_source(action[2])
             #action[2].heat_on = False #not strictly necessary, could send an event
-            yield event_queue.put(('heat_off',action[2].id,env.now))
-        elif action[1] is 'change':
+            yield event_queue.put(Event('heat_off',action[2].id,env.now))
+        elif action[1] == 'change':
             heat_event = 'heat_off' if action[2].heat_on else 'heat_on'
-            event = (heat_event,action[2].id,env.now)
-            print('>> Heat change event created %s, %s, %s' % event)
+            event = Event(heat_event,action[2].id,env.now)
+            print('>> Heat change event created %s, %s, %s' %
+                  (event.kind,event.target,event.timestamp))
             yield event_queue.put(event)
         else:
             raise RuntimeError('heat_source_activity(): Unknown action type: %s'
@@ -32,10 +36,10 @@ def heat_source_activity(env,space,event_queue,actions):
 
 def temp_listener(events):
         """Pick up temp measurement events"""
-        filter = lambda event: (event[0]  == 'temp_measurement')
         while True:
-            event = yield events.get(filter)
-            print('## Temp measurement: %.1f, %s, %s' % (event[1],event[2],event[3]))
+            event = yield events.get(['temp_measurement'])
+            print('## Temp measurement: %.1f, %s, %s' %
+                  (event.payload,event.timestamp,event.source))
 
 
 def test_case_1(env):
@@ -44,7 +48,7 @@ def test_case_1(env):
     low equilibrium.
     """
     room = ContainingSpace(env,288,290,(5*5*3))
-    event_queue = simpy.FilterStore(env)
+    event_queue = EventBus(env)
     hs_1 = CbHeater(env,'h1',room,event_queue,['ping','heat_on','heat_off'],10,100)
     hs_2 = CbHeater(env,'h2',room,event_queue,['ping','heat_on','heat_off'],10,300)
     hs_3 = CbHeater(env,'h3',room,event_queue,['ping','heat_on','heat_off'],10,200)
@@ -70,7 +74,7 @@ def test_case_2(env):
     Initial room temp is 290K with 288K as the low equilibrium.
     """
     room = ContainingSpace(env,288,290,(5*5*3))
-    event_queue = simpy.FilterStore(env)
+    event_queue = EventBus(env)
     hs_1 = CbHeater(env,'heater1',room,event_queue,
                     ['ping','heat_on','heat_off'],60,300)
     tmeter1 = CbThermometer(env,'thermometer1',room,event_queue,['ping'],20)
@@ -86,14 +90,41 @@ def test_case_2(env):
     # End of run
     print('#### End of test_case_2 after %d seconds ####' % SIM_TIME)
 
+def test_case_3(env):
+    """Same as test_case_2 with the closed-form temperature model: no
+    periodic update cycle, temperature is computed when it is read.
+    """
+    room = AnalyticContainingSpace(env,288,290,(5*5*3))
+    event_queue = EventBus(env)
+    hs_1 = CbHeater(env,'heater1',room,event_queue,
+                    ['ping','heat_on','heat_off'],60,300)
+    tmeter1 = CbThermometer(env,'thermometer1',room,event_queue,['ping'],20)
+    heat_source_actions = [
+        (100,'add',hs_1),     # add and turn on
+        (300,'change',hs_1)   # turn off
+    ]
+    env.process(heat_source_activity(env,room,event_queue,heat_source_actions))
+    env.process(temp_listener(event_queue))
+    # Execute!
+    print('==== Start of test_case_3 ====')
+    env.run(until=SIM_TIME)
+    # End of run
+    print('#### End of test_case_3 after %d seconds ####' % SIM_TIME)
+
+
 
+def main():
+    cb_trace.configure(level=cb_trace.DEBUG, console=True)
+    env = simpy.Environment()
+    #event_queue = simpy.FilterStore(env) # should it be global? probably yes, if many spaces, now only one
+    #env.process(event_generator(env,event_queue,31))
+    #heater1 = CbHeater(env,'heater1',None,event_queue,['ping','heat_on','heat_off'],10,25)
+    #tmeter1 = CbThermometer(env,'temp1',None,event_queue,['ping'],10)
+    #env.run(until=350)
+    #test_case_1(env)
+    test_case_2(env)
+    #test_case_3(env)
 
 ## run tests
-env = simpy.Environment()
-#event_queue = simpy.FilterStore(env) # should it be global? probably yes, if many spaces, now only one
-#env.process(event_generator(env,event_queue,31))
-#heater1 = CbHeater(env,'heater1',None,event_queue,['ping','heat_on','heat_off'],10,25)
-#tmeter1 = CbThermometer(env,'temp1',None,event_queue,['ping'],10)
-#env.run(until=350)
-#test_case_1(env)
-test_case_2(env)
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+"""
+Typed events for the event stream of a colony
+
+An Event has fixed fields instead of tuple positions whose meaning depends
+on the kind:
+
+- kind: what happened ('heat_on', 'temp_measurement', ...)
+- target: id of the receiving bacterium, None for any receiver
+- timestamp: simulated time the event was created at
+- payload: the value carried, e.g. a temperature reading
+- source: id of the bacterium that sent it
+
+Events use __slots__, so they have no per-instance __dict__. Like other
+objects they are equal (and hash) only to themselves, as a pooled event
+changes its fields; compare fields() for their values. The bus and
+the bacteria still accept the tuple events used so far, ('heat_on', id,
+now) and ('temp_measurement', value, now, id); the accessor functions below
+read the fields of both.
+
+High-rate kinds can recycle their events through an EventPool. Only the
+last holder of an event may release it: an event broadcast to several
+receivers, or still sitting in a dead-letter buffer, must not be. Readings
+of thermometers come from CbThermometer.event_pool if it is set, and the
+consumer of the readings releases them when done:
+
+    CbThermometer.event_pool = EventPool()
+    ...
+    event = yield event_queue.get(['temp_measurement'])
+    readings.append(event.payload)
+    CbThermometer.event_pool.release(event)
+
+"""
+
+
+#kinds whose tuple events carry a value instead of a target:
+#(kind, value, timestamp, source)
+VALUE_KINDS = frozenset(['temp_measurement'])
+
+
+class Event(object):
+    __slots__ = ('kind', 'target', 'timestamp', 'payload', 'source')
+
+    def __init__(self, kind, target=None, timestamp=None, payload=None,
+                 source=None):
+        self.kind = kind
+        self.target = target
+        self.timestamp = timestamp
+        self.payload = payload
+        self.source = source
+
+    def fields(self):
+        """The fields as a tuple, in the order of the constructor"""
+        return (self.kind, self.target, self.timestamp, self.payload,
+                self.source)
+
+    def __repr__(self):
+        return 'Event(%r, %r, %r, %r, %r)' % self.fields()
+
+
+class EventPool(object):
+    """Free list of Event objects for high-rate kinds"""
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self._free = []
+        self.created = 0
+        self.reused = 0
+
+    def acquire(self, kind, target=None, timestamp=None, payload=None,
+                source=None):
+        if self._free:
+            event = self._free.pop()
+            event.kind = kind
+            event.target = target
+            event.timestamp = timestamp
+            event.payload = payload
+            event.source = source
+            self.reused += 1
+            return event
+        self.created += 1
+        return Event(kind, target, timestamp, payload, source)
+
+    def release(self, event):
+        """Hand event back for reuse. The caller must hold the last
+        reference to it."""
+        if len(self._free) < self.capacity:
+            event.payload = event.source = None
+            self._free.append(event)
+
+
+def event_key(event):
+    """(kind, target) of an Event or of a tuple event. Tuple events of
+    VALUE_KINDS have no target."""
+    if isinstance(event, Event):
+        return event.kind, event.target
+    if event[0] in VALUE_KINDS:
+        return event[0], None
+    return event[0], event[1]
+
+
+def kind_of(event):
+    if isinstance(event, Event):
+        return event.kind
+    return event[0]
+
+
+def timestamp_of(event):
+    """Creation time of event, None if it has none"""
+    if isinstance(event, Event):
+        return event.timestamp
+    try:
+        return event[2]
+    except (IndexError, TypeError):
+        return None
+
+
+def source_of(event):
+    """Sender of event (the fourth item of a tuple event), None if it has
+    none, like ('heat_on', id, now)"""
+    if isinstance(event, Event):
+        return event.source
+    try:
+        return event[3]
+    except (IndexError, TypeError):
+        return None
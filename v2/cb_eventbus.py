@@ -0,0 +1,493 @@
+"""
+Indexed event bus for a colony of computational bacteria
+
+Drop-in replacement for the simpy.FilterStore shared by CbBase instances.
+A FilterStore runs every waiting getter's filter function against every
+queued event on each put, so dispatch cost grows with colony size times
+backlog. The bus instead indexes both waiting getters and queued events by
+(event kind, target id), which makes delivering an event and serving a get
+a constant time operation.
+
+Events are cb_event.Event objects, or tuples whose first item is the kind
+of the event and the second one the id of the receiver (measurements,
+('temp_measurement', value, now, id), have no receiver). The bus indexes
+them on their kind and target; an index entry is removed as soon as it is
+empty, so receivers coming and going do not grow the bus. A target of
+None means "any receiver" of that kind: the event is handed to exactly one
+of the bacteria listening for it.
+
+Getters ask for a list of kinds and a target id. Consumers that are not
+bacteria (e.g. a temperature listener) can leave out the target to get
+every event of the given kinds regardless of its target.
+
+Kinds can be put into broadcast mode (e.g. 'ping' for health checks): an
+untargeted event of such a kind reaches every receiver subscribed to the
+kind instead of just one of them. The very same event object is handed to
+(or queued for) each subscriber, so fan-out costs one index operation per
+subscriber and nothing is copied or put back into the queue.
+
+The number of queued events of a kind can be bounded with set_capacity().
+When a kind is full, its policy decides what happens to a new event:
+
+- BLOCK: the put stays pending (a producer yielding it waits) until an
+  event of the kind is taken. Producers that do not yield their puts are
+  not held back, so at most max_waiting puts (default: the capacity) wait
+  per kind; further events are dropped like with DROP_NEWEST. Broadcast
+  deliveries are never blocked; they drop the oldest event instead.
+- DROP_OLDEST: the oldest queued event of the kind is discarded.
+- DROP_NEWEST: the new event is discarded.
+- KEEP_LATEST: a queued event from the same source (source_key(event),
+  by default the source of an Event or the id of the sender in
+  ('temp_measurement', value, now, id))
+  is replaced by the new one; when full, the oldest event is discarded.
+  Events without a source, like ('heat_on', id, now), all count as coming
+  from the same one unless another source_key is given (e.g. their
+  target).
+
+dropped and blocked count the discarded events and held back puts per
+kind, dispatched the events handed to a getter or queued (once per
+subscriber for broadcasts).
+
+Queued events can expire: a put can give a time to live in simulated
+time, or set_ttl() gives one to every event of a kind. The time to live
+counts from the put, also for a put that waits for room under BLOCK; an
+expired waiting put is given up and its producer carries on. Expiry is
+lazy: expired events are evicted on the next put or get (or expire())
+into a bounded dead-letter buffer, stamped with the time they expired at,
+together with the events discarded by the capacity policies.
+undelivered() sums up per (kind, target) what was expired, dropped or is
+still queued, and whether anybody subscribed to it, which shows events
+sent to bacteria that do not exist.
+
+With a trace_recorder (a cb_replay.TraceRecorder) set, every put,
+broadcast() and deliver() and every event handed to a getter is written
+to its trace.
+
+"""
+
+from collections import Counter, OrderedDict, deque
+import heapq
+import itertools
+
+import simpy
+
+from .cb_event import event_key, kind_of, source_of
+
+ANY = object()  # target of a getter accepting events for any receiver
+
+#policies for full kinds
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+KEEP_LATEST = 'keep_latest'
+
+
+class BusGet(simpy.Event):
+    """Request for the next event matching one of kinds and target.
+
+    Like simpy's store requests, a pending get can be cancelled (or used
+    as a context manager) when the waiting process is interrupted.
+    """
+    def __init__(self, bus, kinds, target):
+        super().__init__(bus.env)
+        self.bus = bus
+        self.kinds = kinds
+        self.target = target
+        self.seq = next(bus._seq)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cancel()
+
+    def cancel(self):
+        """Withdraw the request if it has not been served yet"""
+        if not self.triggered:
+            self.bus._remove_getter(self)
+
+
+class EventBus(object):
+
+    def __init__(self, env, broadcast_kinds=(), dead_letter_capacity=1000):
+        self.env = env
+        self.broadcast_kinds = set(broadcast_kinds)
+        self._seq = itertools.count()
+        self._subscribers = {}   # kind -> OrderedDict of receiver ids
+        #queued events: seq -> (target, event), indexed twice so that both
+        #targeted and kind-only getters find their head in O(1)
+        self._items = {}         # (kind, target) -> OrderedDict
+        self._kind_items = {}    # kind -> OrderedDict
+        #waiting getters, in arrival order
+        self._getters = {}       # (kind, target) -> OrderedDict
+        self._kind_getters = {}  # kind -> OrderedDict
+        #bounded kinds
+        self._limits = {}        # kind -> (capacity, policy, source_key,
+                                 #          max_waiting)
+        self._latest = {}        # (kind, source) -> seq, for KEEP_LATEST
+        #kind -> deque of (put event, event, expires at, seq)
+        self._blocked_puts = {}
+        self.dropped = Counter()
+        self.blocked = Counter()
+        self.dispatched = Counter()
+        #expiry and dead letters
+        self._ttls = {}          # kind -> time to live
+        self._expiry = []        # heap of (expires at, seq, kind)
+        self.dead_letters = deque(maxlen=dead_letter_capacity)
+        self._undelivered = Counter()  # (reason, kind, target) -> count
+        self.trace_recorder = None
+
+    def __len__(self):
+        """Number of queued (not yet delivered) events"""
+        return sum(len(items) for items in self._kind_items.values())
+
+    def idle(self):
+        """True if no event is queued or waiting to be put"""
+        return (not any(self._kind_items.values()) and
+                not any(self._blocked_puts.values()))
+
+    def put(self, event, ttl=None):
+        """Deliver event to a waiting getter or queue it. A queued event
+        expires after ttl (default: the ttl of its kind, if any).
+
+        Returns an already triggered simpy event, so producers can keep
+        doing ``yield bus.put(event)`` like with a simpy store.
+        """
+        if self._expiry:
+            self.expire()
+        if self.trace_recorder is not None:
+            self.trace_recorder.put(self.env.now, event)
+        done = self.env.event()
+        if self._dispatch(event, ttl):
+            done.succeed()
+            return done
+        kind, target = event_key(event)
+        if kind not in self._blocked_puts:
+            self._blocked_puts[kind] = deque()
+        blocked = self._blocked_puts[kind]
+        if len(blocked) >= self._limits[kind][3]:
+            #nobody has to wait for this put to go through: do not pile it up
+            self.dropped[kind] += 1
+            self._dead_letter('dropped', target, event)
+            done.succeed()
+        else:
+            if ttl is None:
+                ttl = self._ttls.get(kind)
+            expires_at = None if ttl is None else self.env.now + ttl
+            seq = next(self._seq)
+            blocked.append((done, event, expires_at, seq))
+            if expires_at is not None:
+                heapq.heappush(self._expiry, (expires_at, seq, kind))
+            self.blocked[kind] += 1
+        return done
+
+    def set_ttl(self, kind, ttl):
+        """Time to live of queued events of kind (None: no expiry)"""
+        if ttl is None:
+            self._ttls.pop(kind, None)
+        else:
+            self._ttls[kind] = ttl
+
+    def expire(self):
+        """Move the queued events and waiting puts whose time to live is
+        over to the dead letters"""
+        now = self.env.now
+        while self._expiry and self._expiry[0][0] <= now:
+            expires_at, seq, kind = heapq.heappop(self._expiry)
+            if seq in self._kind_items.get(kind, ()):
+                target, event = self._kind_items[kind][seq]
+                self._remove_item(kind, seq)
+                self._dead_letter('expired', target, event, expires_at)
+                if kind in self._blocked_puts:
+                    self._admit(kind)
+            elif self._blocked_puts.get(kind):
+                self._expire_waiting(kind, seq, expires_at)
+
+    def undelivered(self):
+        """Events expired, dropped or still queued, per (kind, target),
+        with whether target (or any receiver, for untargeted events) is
+        subscribed to the kind"""
+        self.expire()
+        counts = Counter(self._undelivered)
+        for target, event in self.queued():
+            counts[('queued', kind_of(event), target)] += 1
+        summary = {}
+        for (reason, kind, target), count in counts.items():
+            entry = summary.get((kind, target))
+            if entry is None:
+                subscribers = self._subscribers.get(kind, ())
+                entry = summary[(kind, target)] = {
+                    'expired': 0, 'dropped': 0, 'queued': 0,
+                    'subscribed': (target in subscribers if target is not None
+                                   else bool(subscribers))}
+            entry[reason] += count
+        return summary
+
+    def set_capacity(self, kind, capacity, policy=BLOCK, source_key=None,
+                     max_waiting=None):
+        """Bound the number of queued events of kind (None: unbounded).
+        With BLOCK, at most max_waiting puts (default: capacity) wait."""
+        if capacity is None:
+            self._limits.pop(kind, None)
+            return
+        if policy not in (BLOCK, DROP_OLDEST, DROP_NEWEST, KEEP_LATEST):
+            raise ValueError('set_capacity(): unknown policy %s' % policy)
+        self._limits[kind] = (capacity, policy, source_key or source_of,
+                              capacity if max_waiting is None else max_waiting)
+
+    def stats(self):
+        """Queued, dispatched, dropped and blocked events per kind"""
+        return dict((kind, {'queued': len(self._kind_items.get(kind, ())),
+                            'dispatched': self.dispatched[kind],
+                            'dropped': self.dropped[kind],
+                            'blocked': self.blocked[kind],
+                            'waiting_puts':
+                                len(self._blocked_puts.get(kind, ()))})
+                    for kind in set(self._kind_items) | set(self.dropped) |
+                    set(self.blocked) | set(self.dispatched))
+
+    def broadcast(self, event):
+        """Deliver event to every receiver subscribed to its kind,
+        whatever the kind's mode"""
+        kind = kind_of(event)
+        if self._expiry:
+            self.expire()
+        if self.trace_recorder is not None:
+            self.trace_recorder.broadcast(self.env.now, event)
+        for target in list(self._subscribers.get(kind, ())):
+            self._deliver(kind, event, target)
+        done = self.env.event()
+        done.succeed()
+        return done
+
+    def subscribe(self, kinds, target):
+        """Register target as a receiver of broadcasts of kinds"""
+        if isinstance(kinds, str):
+            kinds = (kinds,)
+        for kind in kinds:
+            if kind not in self._subscribers:
+                self._subscribers[kind] = OrderedDict()
+            self._subscribers[kind][target] = None
+
+    def unsubscribe(self, target, kinds=None):
+        """Stop broadcasting kinds (all kinds by default) to target"""
+        if isinstance(kinds, str):
+            kinds = (kinds,)
+        for kind in (kinds if kinds is not None else self._subscribers):
+            self._subscribers.get(kind, {}).pop(target, None)
+
+    def get(self, kinds, target=ANY):
+        """Return an event that is triggered with the next event of one of
+        kinds addressed to target (or to any receiver)."""
+        if isinstance(kinds, str):
+            kinds = (kinds,)
+        if self._expiry:
+            self.expire()
+        request = BusGet(self, tuple(kinds), target)
+        event = self._take(request)
+        if event is not None:
+            self._serve(request, event)
+        else:
+            self._add_getter(request)
+        return request
+
+    def queued(self, expiry=False):
+        """(target, event) of the queued events, oldest first. With expiry,
+        (target, event, time it expires at or None)."""
+        queued = []
+        for items in self._kind_items.values():
+            queued.extend(items.items())
+        queued.sort(key=lambda item: item[0])
+        if not expiry:
+            return [item for seq, item in queued]
+        expires = dict((seq, expires_at)
+                       for expires_at, seq, kind in self._expiry)
+        return [item + (expires.get(seq),) for seq, item in queued]
+
+    def settings(self):
+        """Capacities (kind -> [capacity, policy, max_waiting]) and times to
+        live (kind -> ttl) set on the bus, as plain values; source_key
+        functions are left out"""
+        return {'capacities': dict((kind, [limit[0], limit[1], limit[3]])
+                                   for kind, limit in self._limits.items()),
+                'ttls': dict(self._ttls)}
+
+    def _dispatch(self, event, ttl=None): #private
+        """Deliver or queue event, False if it has to wait for room"""
+        kind, target = event_key(event)
+        if target is None and kind in self.broadcast_kinds:
+            for subscriber in list(self._subscribers.get(kind, ())):
+                self._deliver(kind, event, subscriber, ttl)
+            return True
+        if target is None:
+            request = _first(self._kind_getters.get(kind))
+        else:
+            request = _first(self._getters.get((kind, target)))
+            any_request = _first(self._getters.get((kind, ANY)))
+            if request is None or (any_request is not None and
+                                   any_request.seq < request.seq):
+                request = any_request
+        if request is not None:
+            self._remove_getter(request)
+            self._serve(request, event)
+        elif not self._enqueue(kind, target, event, True, ttl):
+            return False
+        self.dispatched[kind] += 1
+        return True
+
+    def deliver(self, event, target, ttl=None):
+        """Hand event to the receiver target, or queue it for target,
+        whatever the target of the event itself"""
+        if self.trace_recorder is not None:
+            self.trace_recorder.deliver(self.env.now, target, event)
+        self._deliver(kind_of(event), event, target, ttl)
+
+    def _deliver(self, kind, event, target, ttl=None): #private
+        self.dispatched[kind] += 1
+        request = _first(self._getters.get((kind, target)))
+        if request is not None:
+            self._remove_getter(request)
+            self._serve(request, event)
+        else:
+            self._enqueue(kind, target, event, False, ttl)
+
+    def _serve(self, request, event): #private
+        if self.trace_recorder is not None:
+            self.trace_recorder.get(self.env.now, request.target, event)
+        request.succeed(event)
+
+    def _enqueue(self, kind, target, event, may_block, ttl=None): #private
+        """Queue event, applying the limit of kind. Returns False if the
+        event was not queued because the kind is full and blocking."""
+        limit = self._limits.get(kind)
+        if limit is not None:
+            capacity, policy, source_key = limit[:3]
+            if policy == KEEP_LATEST:
+                source = source_key(event)
+                replaced = self._latest.get((kind, source))
+                if replaced is not None:
+                    self._drop(kind, replaced)
+            if len(self._kind_items.get(kind, ())) >= capacity:
+                if policy == BLOCK and may_block:
+                    return False
+                if policy == DROP_NEWEST:
+                    self.dropped[kind] += 1
+                    self._dead_letter('dropped', target, event)
+                    return True
+                self._drop(kind, _first(self._kind_items[kind]))
+        seq = next(self._seq)
+        if ttl is None:
+            ttl = self._ttls.get(kind)
+        if ttl is not None:
+            heapq.heappush(self._expiry, (self.env.now + ttl, seq, kind))
+        if limit is not None and limit[1] == KEEP_LATEST:
+            self._latest[(kind, source)] = seq
+        key = (kind, target)
+        if key not in self._items:
+            self._items[key] = OrderedDict()
+        self._items[key][seq] = event
+        if kind not in self._kind_items:
+            self._kind_items[kind] = OrderedDict()
+        self._kind_items[kind][seq] = (target, event)
+        return True
+
+    def _remove_item(self, kind, seq): #private
+        target, event = self._kind_items[kind].pop(seq)
+        items = self._items[(kind, target)]
+        del items[seq]
+        if not items:
+            del self._items[(kind, target)]
+        limit = self._limits.get(kind)
+        if limit is not None and limit[1] == KEEP_LATEST:
+            key = (kind, limit[2](event))
+            if self._latest.get(key) == seq:
+                del self._latest[key]
+        return event
+
+    def _drop(self, kind, seq): #private
+        target, event = self._kind_items[kind][seq]
+        self._remove_item(kind, seq)
+        self.dropped[kind] += 1
+        self._dead_letter('dropped', target, event)
+
+    def _dead_letter(self, reason, target, event, time=None): #private
+        if time is None:
+            time = self.env.now
+        self.dead_letters.append((time, reason, target, event))
+        self._undelivered[(reason, kind_of(event), target)] += 1
+
+    def _admit(self, kind): #private
+        """Let blocked puts of kind in while there is room"""
+        blocked = self._blocked_puts.get(kind)
+        limit = self._limits.get(kind)
+        capacity = limit[0] if limit is not None else float('inf')
+        while blocked and len(self._kind_items.get(kind, ())) < capacity:
+            done, event, expires_at, seq = blocked.popleft()
+            ttl = None if expires_at is None else expires_at - self.env.now
+            self._dispatch(event, ttl)
+            done.succeed()
+
+    def _expire_waiting(self, kind, seq, expires_at): #private
+        """Give up the waiting put seq of kind, if it is still waiting"""
+        blocked = self._blocked_puts[kind]
+        for entry in blocked:
+            if entry[3] == seq:
+                blocked.remove(entry)
+                done, event = entry[:2]
+                self._dead_letter('expired', event_key(event)[1], event,
+                                  expires_at)
+                done.succeed()
+                return
+
+    def _take(self, request): #private
+        """Remove and return the oldest queued event matching request"""
+        best = None
+        for kind in request.kinds:
+            if request.target is ANY:
+                candidates = (self._kind_items.get(kind),)
+            else:
+                candidates = (self._items.get((kind, request.target)),
+                              self._items.get((kind, None)))
+            for items in candidates:
+                seq = _first(items)
+                if seq is not None and (best is None or seq < best[0]):
+                    best = (seq, kind)
+        if best is None:
+            return None
+        seq, kind = best
+        event = self._remove_item(kind, seq)
+        if kind in self._blocked_puts:
+            self._admit(kind)
+        return event
+
+    def _add_getter(self, request): #private
+        for kind in request.kinds:
+            key = (kind, request.target)
+            if key not in self._getters:
+                self._getters[key] = OrderedDict()
+            self._getters[key][request] = None
+            if kind not in self._kind_getters:
+                self._kind_getters[kind] = OrderedDict()
+            self._kind_getters[kind][request] = None
+
+    def _remove_getter(self, request): #private
+        for kind in request.kinds:
+            _discard(self._getters, (kind, request.target), request)
+            _discard(self._kind_getters, kind, request)
+
+
+def _discard(index, key, item):
+    """Remove item from the OrderedDict index[key], and the entry once it
+    is empty"""
+    ordered = index.get(key)
+    if ordered is not None:
+        ordered.pop(item, None)
+        if not ordered:
+            del index[key]
+
+
+def _first(ordered):
+    """First key of an OrderedDict, or None if it is missing or empty"""
+    if ordered:
+        return next(iter(ordered))
+    return None
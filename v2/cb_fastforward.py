@@ -0,0 +1,141 @@
+"""
+Fast-forwarding a colony through steady states
+
+Long runs of a facility spend most of their simulated time with nothing
+going on: the heaters are settled, every room sits at its equilibrium and
+the thermometers keep reading the same temperature until the next
+scheduled action. A FastForward watches for such a steady state and jumps
+over it:
+
+- every space is steady (AnalyticContainingSpace.steady(): its
+  temperature stays where it is; spaces without steady() never are)
+- the event bus is idle: no event queued or waiting to be put, and
+  nothing else is due at the current time (e.g. a bacterium about to
+  handle an event it was just given)
+- the next scheduled action (ScheduleDriver.next_time()) or the horizon
+  until, whichever comes first, is later than now
+
+The periodic bacteria on the scheduler (a cb_scheduler.TickScheduler) are
+then moved on to their first wake up at or after that time, so the
+environment has nothing left to do in between and simpy goes straight to
+the next action. The skipped wake ups are kept as SkippedIntervals: who
+would have woken up when, and the temperature a thermometer would have
+read. reconstruct() gives the readings back; with record_skipped the
+thermometers having a recorder get them recorded at the time of the jump.
+
+    scheduler = TickScheduler(env)
+    recorder = TemperatureRecorder()
+    facility = load_facility(env, 'facility.json', scheduler, recorder)
+    forward = FastForward(env, facility.rooms.values(), scheduler,
+                          facility.driver, facility.event_queue,
+                          until=facility.until)
+    env.run(until=facility.until)
+
+Only the wake ups of the scheduler are skipped: bacteria running their
+own acting process keep waking up, which is still correct but leaves
+less to jump over. Events put by processes other than the bacteria and
+the driver are not foreseen, so they must not be due during a steady
+state. Readings of thermometers without a recorder would have been put
+on the bus; they are only found in the skipped intervals.
+
+"""
+
+from collections import namedtuple
+
+from .cb_trace import get_tracer
+
+_trace = get_tracer('fastforward')
+
+CHECK_INTERVAL = 60  # seconds between checks for a steady state
+
+# readings: (bacterium id, first skipped wake up, period, number skipped,
+#            temperature read or None) per skipped bacterium
+SkippedInterval = namedtuple('SkippedInterval', 'start end readings')
+
+
+class FastForward(object):
+
+    def __init__(self, env, spaces, scheduler, driver=None, event_stream=None,
+                 until=None, check_interval=CHECK_INTERVAL,
+                 record_skipped=True):
+        self.env = env
+        self.spaces = list(spaces)
+        self.scheduler = scheduler
+        self.driver = driver
+        self.events = event_stream
+        self.until = until
+        self.check_interval = check_interval
+        self.record_skipped = record_skipped
+        self.skipped = []  # SkippedIntervals, in time order
+        self.process = env.process(self.watching())
+
+    def watching(self):
+        while True:
+            yield self.env.timeout(self.check_interval)
+            while self.env.peek() <= self.env.now:
+                #let everything else due now happen first
+                yield self.env.timeout(0)
+            target = self.steady_until()
+            if target is not None:
+                self.skip(target)
+                yield self.env.timeout(target - self.env.now)
+
+    def steady_until(self):
+        """Time up to which the colony stays as it is, None if it is not
+        steady or there is nothing to skip"""
+        if self.events is not None and not self.events.idle():
+            return None
+        if self.env.peek() <= self.env.now:
+            return None
+        for space in self.spaces:
+            steady = getattr(space, 'steady', None)
+            if steady is None or not steady():
+                return None
+        target = self.driver.next_time() if self.driver is not None else None
+        if self.until is not None and (target is None or self.until < target):
+            target = self.until
+        if target is None or target <= self.env.now:
+            return None
+        return target
+
+    def skip(self, target):
+        """Move the scheduler on to target and keep what was skipped"""
+        readings = []
+        for cb, first, count in self.scheduler.fast_forward(target):
+            value = None
+            if hasattr(cb, 'last_temp_read') and cb.context is not None:
+                value = cb.context.temperature
+                cb.last_temp_read = value
+                recorder = cb.recorder
+                if self.record_skipped and recorder is not None:
+                    for i in range(count):
+                        recorder.record(cb.id, first + i * cb.period, value)
+            readings.append((cb.id, first, cb.period, count, value))
+        _trace.info('at %s skipping to %s (%d bacteria)', self.env.now,
+                    target, len(readings))
+        self.skipped.append(SkippedInterval(self.env.now, target,
+                                            tuple(readings)))
+
+    def skipped_time(self):
+        return sum(interval.end - interval.start for interval in self.skipped)
+
+    def skipped_wake_ups(self):
+        return sum(reading[3] for interval in self.skipped
+                   for reading in interval.readings)
+
+    def reconstruct(self, id):
+        """(time, temperature) of the skipped readings of bacterium id"""
+        return reconstruct(self.skipped, id)
+
+
+def reconstruct(skipped, id):
+    """(time, temperature) of the readings of bacterium id skipped in the
+    SkippedIntervals skipped"""
+    readings = []
+    for interval in skipped:
+        for reading in interval.readings:
+            if reading[0] == id:
+                first, period, count, value = reading[1:]
+                readings.extend((first + i * period, value)
+                                for i in range(count))
+    return readings
@@ -1,8 +1,16 @@
-from cb_base import CbBase
+from .cb_base import CbBase
+from .cb_event import kind_of
+from .cb_trace import get_tracer
+
+_trace = get_tracer('heater')
 
 class CbHeater(CbBase):
     """A computational bacterium producing heat a.k.a heater
+
+    A heater only reacts to events, so it has no periodic activity.
     """
+    reactive = True
+
     def __init__(self, env, id, context, event_stream, event_kinds, period, output, heat_on=False):
 
         super().__init__(env, id, context, event_stream, event_kinds, period)
@@ -24,12 +32,13 @@ class CbHeater(CbBase):
 ##            print ("{} at {} not producing heat".format(self.id,self.env.now))
 
     def on_interrupt_activity(self):
-        print('{} at {} interrupted with {}'.format(self.id,self.env.now,self.event))
+        _trace.info('%s at %s interrupted with %s', self.id,self.env.now,self.event)
         changed = False
-        if self.event[0] == 'heat_on' and not self.heat_on:
+        kind = kind_of(self.event)
+        if kind == 'heat_on' and not self.heat_on:
             self.heat_on = True
             changed = True
-        elif self.event[0] == 'heat_off' and self.heat_on:
+        elif kind == 'heat_off' and self.heat_on:
             self.heat_on = False
             changed = True
         if self.listener_callback and changed:
@@ -0,0 +1,304 @@
+"""
+Feeding external measurement streams into a colony
+
+An IngestBridge reads records from external sources (files replayed
+locally, or a TCP socket standing in for a live feed) and puts them as
+cb_event.Event objects on the event stream of a running simulation.
+
+The sources are read concurrently by an asyncio loop in a thread of its
+own. Records are grouped in batches (batch_size records, or whatever
+arrived within flush_interval seconds) and handed over through a
+thread-safe queue. In the simulation a process polls that queue every
+poll_interval simulated seconds without waiting on it, and injects the
+batches it finds. Neither side waits for the other: a slow source only
+means empty polls, and when the simulation falls behind the reader keeps
+going until the queue is full, after which batches are counted in
+overflowed and dropped.
+
+Records are JSON objects, one per line, with the fields of an Event:
+
+    {"kind": "heat_on", "target": "h1"}
+    {"kind": "temp_measurement", "payload": 291.2, "source": "probe1"}
+
+The timestamp of an injected event is the simulated time it was injected
+at. A "time" field is only used to pace the replay of a file.
+
+The bridge is meant to run in a simpy.rt.RealtimeEnvironment created with
+strict=False (see rt_environment()), so the simulation follows the wall
+clock without failing when it lags behind. A record injected more than
+lag_tolerance wall-clock seconds after it was read is counted in late, and
+dropped if drop_late is set.
+
+    env = rt_environment(factor=0.1)
+    bridge = IngestBridge(env, event_queue, [file_source('feed.jsonl')])
+    bridge.start()
+    env.run(until=600)
+    bridge.stop()
+
+"""
+
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+
+import simpy.rt
+
+from .cb_event import Event
+
+
+def rt_environment(factor=1.0, initial_time=0):
+    """Real-time environment that keeps running when it lags behind"""
+    return simpy.rt.RealtimeEnvironment(initial_time=initial_time,
+                                        factor=factor, strict=False)
+
+
+def parse_record(line):
+    """Fields of the Event described by a JSON line, None for a blank
+    line"""
+    line = line.strip()
+    if not line:
+        return None
+    record = json.loads(line)
+    if not isinstance(record, dict) or 'kind' not in record:
+        raise ValueError('parse_record(): not an event record: %s' % line)
+    return record
+
+
+async def file_source(path, pace=None):
+    """Records of a JSON lines file. With pace, records with a "time"
+    field are spread out like in the recording, pace wall-clock seconds
+    per unit of time."""
+    first = None
+    started = time.monotonic()
+    with open(path) as lines:
+        for line in lines:
+            record = parse_record(line)
+            if record is None:
+                continue
+            if pace is not None and 'time' in record:
+                if first is None:
+                    first = record['time']
+                delay = ((record['time'] - first) * pace -
+                         (time.monotonic() - started))
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)  # let the other sources in
+            yield record
+
+
+async def tcp_source(host, port):
+    """Records sent as JSON lines over a TCP connection, until it is
+    closed"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            record = parse_record(line.decode())
+            if record is not None:
+                yield record
+    finally:
+        writer.close()
+
+
+class IngestBridge(object):
+
+    def __init__(self, env, event_stream, sources, batch_size=100,
+                 flush_interval=0.05, poll_interval=1, lag_tolerance=1.0,
+                 drop_late=False, max_batches=1000):
+        self.env = env
+        self.events = event_stream
+        self.sources = list(sources)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.lag_tolerance = lag_tolerance
+        self.drop_late = drop_late
+        self._batches = queue.Queue(max_batches)  # (read at, records)
+        self._thread = None
+        self._loop = None
+        self._reading = None
+        self.finished = threading.Event()  # all sources exhausted
+        #counters; read, overflowed and errors are updated by the reader
+        #thread, under _lock
+        self._lock = threading.Lock()
+        self.read = 0
+        self.injected = 0
+        self.late = 0
+        self.dropped = 0
+        self.overflowed = 0
+        self.errors = []
+        self.max_lag = 0.0
+
+    def start(self):
+        """Start reading the sources and injecting their records"""
+        self._thread = threading.Thread(target=self._run_reader,
+                                        name='cb-ingest', daemon=True)
+        self._thread.start()
+        self.process = self.env.process(self.injecting())
+
+    def stop(self, timeout=None):
+        """Stop reading (records already read are still injected while the
+        simulation runs)"""
+        if self._reading is not None and not self.finished.is_set():
+            try:
+                self._loop.call_soon_threadsafe(self._reading.cancel)
+            except RuntimeError:
+                pass  # the loop closed in the meantime
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            read, overflowed = self.read, self.overflowed
+            errors = len(self.errors)
+        return dict(read=read, injected=self.injected, late=self.late,
+                    dropped=self.dropped, overflowed=overflowed,
+                    pending=self._batches.qsize(), max_lag=self.max_lag,
+                    errors=errors)
+
+    def injecting(self):
+        """Simulation side: poll the queue and inject the batches found"""
+        while True:
+            self.inject_pending()
+            yield self.env.timeout(self.poll_interval)
+
+    def inject_pending(self):
+        """Inject every batch waiting in the queue, without blocking"""
+        while True:
+            try:
+                read_at, records = self._batches.get_nowait()
+            except queue.Empty:
+                return
+            lag = time.monotonic() - read_at
+            if lag > self.max_lag:
+                self.max_lag = lag
+            if lag > self.lag_tolerance:
+                self.late += len(records)
+                if self.drop_late:
+                    self.dropped += len(records)
+                    continue
+            for record in records:
+                self.events.put(Event(record['kind'], record.get('target'),
+                                      self.env.now, record.get('payload'),
+                                      record.get('source')))
+            self.injected += len(records)
+
+    def _run_reader(self): #private
+        """Reader thread: run the asyncio loop until the sources are done"""
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._reading = self._loop.create_task(self._read_all())
+            self._loop.run_until_complete(self._reading)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.run_until_complete(self._loop.shutdown_asyncgens())
+            self._loop.close()
+            self.finished.set()
+
+    async def _read_all(self): #private
+        records = asyncio.Queue()
+        readers = [asyncio.ensure_future(self._read(source, records))
+                   for source in self.sources]
+        batching = asyncio.ensure_future(self._batch(records))
+        try:
+            await asyncio.gather(*readers)
+            await records.put(None)  # no more records
+            await batching
+        finally:
+            for task in readers + [batching]:
+                task.cancel()
+            await asyncio.gather(*(readers + [batching]),
+                                 return_exceptions=True)
+
+    async def _read(self, source, records): #private
+        try:
+            async for record in source:
+                await records.put(record)
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            #a broken source must not take the others down
+            with self._lock:
+                self.errors.append(error)
+
+    async def _batch(self, records): #private
+        batch = []
+        while True:
+            try:
+                record = await asyncio.wait_for(records.get(),
+                                                self.flush_interval)
+            except asyncio.TimeoutError:
+                #nothing new for a while: hand over what we have
+                if batch:
+                    self._hand_over(batch)
+                    batch = []
+                continue
+            if record is None:
+                if batch:
+                    self._hand_over(batch)
+                return
+            batch.append(record)
+            with self._lock:
+                self.read += 1
+            if len(batch) >= self.batch_size:
+                self._hand_over(batch)
+                batch = []
+
+    def _hand_over(self, batch): #private
+        try:
+            self._batches.put_nowait((time.monotonic(), batch))
+        except queue.Full:
+            with self._lock:
+                self.overflowed += len(batch)
+
+
+def main(argv=None):
+    """Feed JSON lines files (or a TCP feed) into a room with a heater and
+    a thermometer, and report the bridge counters"""
+    from .cb_containingspace import ContainingSpace
+    from .cb_eventbus import EventBus
+    from .cb_heater import CbHeater
+    from .cb_thermometer import CbThermometer
+
+    parser = argparse.ArgumentParser(description='Feed records into a colony')
+    parser.add_argument('files', nargs='*')
+    parser.add_argument('--tcp', default=None, metavar='HOST:PORT')
+    parser.add_argument('--pace', type=float, default=None,
+                        help='wall seconds per unit of record time')
+    parser.add_argument('--factor', type=float, default=0.01,
+                        help='wall seconds per simulated second')
+    parser.add_argument('--until', type=float, default=100)
+    parser.add_argument('--lag-tolerance', type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    sources = [file_source(path, args.pace) for path in args.files]
+    if args.tcp:
+        host, port = args.tcp.rsplit(':', 1)
+        sources.append(tcp_source(host, int(port)))
+    env = rt_environment(args.factor)
+    event_queue = EventBus(env)
+    room = ContainingSpace(env, 288, 290, 5*5*3)
+    heater = CbHeater(env, 'h1', room, event_queue,
+                      ['ping', 'heat_on', 'heat_off'], 60, 300)
+    room.add_heat_source(heater)
+    CbThermometer(env, 't1', room, event_queue, ['ping'], 20)
+    bridge = IngestBridge(env, event_queue, sources,
+                          lag_tolerance=args.lag_tolerance)
+    bridge.start()
+    env.run(until=args.until)
+    bridge.stop(timeout=1)
+    print(json.dumps(dict(bridge.stats(), temperature=room.temperature,
+                          heat_on=heater.heat_on)))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
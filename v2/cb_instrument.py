@@ -0,0 +1,100 @@
+"""
+Opt-in instrumentation of computational bacteria
+
+An Instrumentation collects, per bacterium id and per bacterium class:
+
+- wake_ups: sustenance activities performed after a full sleep
+- interrupts: events handled
+- sustenance_time / interrupt_time: wall-clock seconds spent in
+  sustenance_activity and on_interrupt_activity
+- latency: simulated time from the creation timestamp of an event
+  (its timestamp) to its handling (total, max and count)
+
+Instrumentation is off unless one is set on CbBase (for every bacterium)
+or on single bacteria:
+
+    CbBase.instrumentation = Instrumentation()
+    ...
+    stats = CbBase.instrumentation.snapshot()
+    CbBase.instrumentation.export('stats.json')
+
+"""
+
+import csv
+import json
+
+from .cb_event import timestamp_of
+
+FIELDS = ('wake_ups', 'interrupts', 'sustenance_time', 'interrupt_time',
+          'latency_total', 'latency_max', 'latency_count')
+
+
+class Instrumentation(object):
+
+    def __init__(self):
+        self.bacteria = {}  # id -> (class name, counters)
+
+    def _counters(self, cb): #private
+        entry = self.bacteria.get(cb.id)
+        if entry is None:
+            entry = self.bacteria[cb.id] = (type(cb).__name__,
+                                            dict.fromkeys(FIELDS, 0))
+        return entry[1]
+
+    def wake_up(self, cb, wall_time):
+        counters = self._counters(cb)
+        counters['wake_ups'] += 1
+        counters['sustenance_time'] += wall_time
+
+    def interrupt(self, cb, wall_time, latency=None):
+        counters = self._counters(cb)
+        counters['interrupts'] += 1
+        counters['interrupt_time'] += wall_time
+        if latency is not None:
+            counters['latency_total'] += latency
+            counters['latency_count'] += 1
+            if latency > counters['latency_max']:
+                counters['latency_max'] = latency
+
+    def snapshot(self):
+        """Copy of the counters per bacterium id and summed per class"""
+        bacteria = {}
+        classes = {}
+        for id, (kind, counters) in self.bacteria.items():
+            bacteria[id] = dict(counters, kind=kind)
+            totals = classes.setdefault(kind, dict.fromkeys(FIELDS, 0))
+            for field in FIELDS:
+                if field == 'latency_max':
+                    totals[field] = max(totals[field], counters[field])
+                else:
+                    totals[field] += counters[field]
+            totals['bacteria'] = totals.get('bacteria', 0) + 1
+        return {'bacteria': bacteria, 'classes': classes}
+
+    def export(self, path):
+        """Write a snapshot to path: one row per bacterium if path ends in
+        .csv, the whole snapshot as JSON otherwise"""
+        snapshot = self.snapshot()
+        with open(path, 'w', newline='') as out:
+            if path.endswith('.csv'):
+                writer = csv.writer(out)
+                writer.writerow(('id', 'kind') + FIELDS)
+                for id, counters in sorted(snapshot['bacteria'].items(),
+                                           key=lambda item: str(item[0])):
+                    writer.writerow((id, counters['kind']) +
+                                    tuple(counters[field] for field in FIELDS))
+            else:
+                json.dump(snapshot, out, indent=1, sort_keys=True,
+                          default=str)
+
+    def reset(self):
+        self.bacteria.clear()
+
+
+def event_latency(env, event):
+    """Simulated time since the creation of event, None if the event has
+    no timestamp"""
+    timestamp = timestamp_of(event)
+    if timestamp is None:
+        return None
+    return env.now - timestamp
@@ -0,0 +1,173 @@
+"""
+Columnar recorder for thermometer readings
+
+A TemperatureRecorder keeps the readings of each thermometer in two
+growable typed arrays (array('d') of times and of values) instead of one
+tuple per reading on the event bus. A CbThermometer created with
+recorder=... records its readings there directly.
+
+Readings can be streamed to disk in chunks: every chunk_size readings the
+new ones are appended to a sink, a CsvSink (id,time,value rows) or an
+NpySink (a .npy file of (id, time, value) records that numpy can open
+memory-mapped with numpy.load(path, mmap_mode='r')). With
+keep_in_memory=False the arrays only hold the readings not written out
+yet, so memory stays bounded during long runs.
+
+Windowed queries (window(), mean()) use binary search on the times, which
+are recorded in increasing order. Queries (latest(), window(), mean())
+need all the readings in memory: with keep_in_memory=False and a sink
+they raise a RuntimeError; read the sink's file instead.
+
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+import csv
+import json
+import struct
+
+
+class TemperatureRecorder(object):
+
+    def __init__(self, sink=None, chunk_size=100000, keep_in_memory=True):
+        self.sink = sink
+        self.chunk_size = chunk_size
+        self.keep_in_memory = keep_in_memory
+        self.series = {}     # thermometer id -> (times, values)
+        self._flushed = {}   # thermometer id -> readings already written
+        self._pending = 0    # readings not written yet
+
+    def record(self, id, time, value):
+        series = self.series.get(id)
+        if series is None:
+            series = self.series[id] = (array('d'), array('d'))
+            self._flushed[id] = 0
+        series[0].append(time)
+        series[1].append(value)
+        self._pending += 1
+        if self.sink is not None and self._pending >= self.chunk_size:
+            self.flush()
+
+    def __len__(self):
+        return sum(len(times) for times, values in self.series.values())
+
+    def times(self, id):
+        return self.series[id][0]
+
+    def values(self, id):
+        return self.series[id][1]
+
+    def latest(self, id):
+        """(time, value) of the last reading of thermometer id"""
+        times, values = self._queried(id, 'latest')
+        return times[-1], values[-1]
+
+    def window(self, id, start, end):
+        """Times and values of the readings of thermometer id with
+        start <= time <= end"""
+        times, values = self._queried(id, 'window')
+        first = bisect_left(times, start)
+        last = bisect_right(times, end)
+        return times[first:last], values[first:last]
+
+    def mean(self, id, start, end):
+        """Mean of the readings in the window, None if there are none"""
+        values = self.window(id, start, end)[1]
+        return sum(values) / len(values) if values else None
+
+    def _queried(self, id, query): #private
+        if not self.keep_in_memory and self.sink is not None:
+            raise RuntimeError('%s(): readings written to the sink are not '
+                               'kept in memory (keep_in_memory=False)'
+                               % query)
+        return self.series[id]
+
+    def flush(self):
+        """Write the readings recorded since the last flush to the sink"""
+        if self.sink is None:
+            return
+        for id, (times, values) in self.series.items():
+            first = self._flushed[id]
+            if first < len(times):
+                self.sink.write(id, times[first:], values[first:])
+            if self.keep_in_memory:
+                self._flushed[id] = len(times)
+            else:
+                del times[:]
+                del values[:]
+                self._flushed[id] = 0
+        self._pending = 0
+
+    def close(self):
+        self.flush()
+        if self.sink is not None:
+            self.sink.close()
+
+
+class CsvSink(object):
+    """Appends readings to a CSV file as id,time,value rows"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(('id', 'time', 'value'))
+
+    def write(self, id, times, values):
+        self.writer.writerows(zip((id,) * len(times), times, values))
+
+    def close(self):
+        self.file.close()
+
+
+NPY_HEADER_SIZE = 128  # fixed, so the row count can be patched in place
+NPY_DESCR = "[('id', '<i4'), ('time', '<f8'), ('value', '<f8')]"
+NPY_RECORD = struct.Struct('<idd')
+
+
+class NpySink(object):
+    """Appends readings to a .npy file of (id, time, value) records.
+
+    The file is written without numpy: the header has a fixed size and its
+    row count is updated on close. Thermometer ids are stored as indexes
+    into the list saved next to it in path + '.ids.json'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.ids = []
+        self._index = {}
+        self.rows = 0
+        self.file.write(_npy_header(0))
+
+    def write(self, id, times, values):
+        index = self._index.get(id)
+        if index is None:
+            index = self._index[id] = len(self.ids)
+            self.ids.append(id)
+        self.file.write(b''.join(NPY_RECORD.pack(index, time, value)
+                                 for time, value in zip(times, values)))
+        self.rows += len(times)
+
+    def close(self):
+        self.file.seek(0)
+        self.file.write(_npy_header(self.rows))
+        self.file.close()
+        with open(self.path + '.ids.json', 'w') as out:
+            json.dump(self.ids, out)
+
+
+def _npy_header(rows):
+    header = ("{'descr': %s, 'fortran_order': False, 'shape': (%d,), }"
+              % (NPY_DESCR, rows))
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + '\n'
+    return (b'\x93NUMPY\x01\x00' + struct.pack('<H', len(header)) +
+            header.encode('latin1'))
+
+
+def load_npy(path):
+    """Memory-map a file written by NpySink. Returns the record array and
+    the list of thermometer ids its id column refers to (needs numpy)."""
+    import numpy as np
+    with open(path + '.ids.json') as ids:
+        return np.load(path, mmap_mode='r'), json.load(ids)
@@ -0,0 +1,410 @@
+"""
+Recording a colony to a binary trace and replaying it
+
+A TraceRecorder attached to an EventBus, to spaces and to bacteria writes
+a record for
+
+- every event put on the bus (put), broadcast (broadcast), handed to a
+  receiver with deliver() (deliver) and handed to a getter (get)
+- every heat source added to or removed from a space, and every change of
+  a source's output (add, remove, output)
+- every event handled by a bacterium (interrupt)
+
+Records are packed with struct: a type byte, the simulated time and the
+fields of the record. Strings (kinds, ids) are written once into a string
+table in the trace and referred to by index afterwards. Payloads can be
+None, booleans, numbers, strings, and tuples, lists and dicts of them;
+other objects are pickled, and for objects that cannot be pickled their
+repr is recorded instead (counted in TraceRecorder.unpicklable). Reading
+a trace unpickles those payloads, which can run arbitrary code: only read
+and replay traces from a trusted source.
+
+read_trace() turns a trace back into tuples. A Replay re-drives a colony
+from them: the recorded puts, broadcasts, deliveries and heat source
+changes are applied at their recorded times from a chain of env
+callbacks, with no generator processes producing them, so a plain
+simpy.Environment replays as fast as possible. Only the consumers (the
+bacteria listening on the bus and the spaces) do work, which reproduces
+an incident offline or benchmarks the consumer side alone. Events can be
+limited to some kinds, e.g. to leave out the 'temp_measurement' events
+the replayed thermometers put themselves.
+
+    recorder = TraceRecorder('incident.trace')
+    recorder.attach(event_queue, rooms, bacteria)
+    env.run(until=SIM_TIME)
+    recorder.close()
+    ...
+    replay = Replay(env, read_trace('incident.trace'), event_queue, rooms,
+                    bacteria, kinds=['ping', 'heat_on', 'heat_off'])
+    env.run()
+
+Events put at the same simulated time are replayed in recorded order,
+but their order relative to other activity at that time (e.g. a wake-up)
+can differ from the recorded run. diff_traces() compares a recorded and a
+replayed trace.
+
+"""
+
+import pickle
+import struct
+import sys
+from collections import Counter
+
+from .cb_event import Event, kind_of
+from .cb_eventbus import ANY
+
+MAGIC = b'CBTRACE1'
+
+#record types
+PUT = 'put'
+GET = 'get'
+INTERRUPT = 'interrupt'
+ADD = 'add'
+REMOVE = 'remove'
+OUTPUT = 'output'
+BROADCAST = 'broadcast'
+DELIVER = 'deliver'
+
+_STRING = 0
+_TYPES = (None, PUT, GET, INTERRUPT, ADD, REMOVE, OUTPUT, BROADCAST, DELIVER)
+_CODES = dict((kind, code) for code, kind in enumerate(_TYPES) if kind)
+
+#value tags
+(_NONE, _STR, _FLOAT, _INT, _ANY, _TRUE, _FALSE, _TUPLE, _LIST, _DICT,
+ _PICKLED, _REPR) = range(12)
+
+_HEAD = struct.Struct('<Bd')   # record type, time
+_BYTE = struct.Struct('<B')
+_UINT = struct.Struct('<I')
+_DOUBLE = struct.Struct('<d')
+_LONG = struct.Struct('<q')
+
+
+class TraceRecorder(object):
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+        self._strings = {}
+        self._spaces = {}  # id(space) -> index
+        self.records = 0
+        self.unpicklable = 0
+
+    def attach(self, event_stream=None, spaces=(), bacteria=()):
+        """Record the bus event_stream, spaces and bacteria. Setting
+        CbBase.trace_recorder records all bacteria."""
+        if event_stream is not None:
+            event_stream.trace_recorder = self
+        for space in spaces:
+            self._space_index(space)
+            space.trace_recorder = self
+        for cb in bacteria:
+            cb.trace_recorder = self
+
+    def put(self, time, event):
+        self._write(PUT, time, self._event(event))
+
+    def get(self, time, target, event):
+        self._write(GET, time, self._value(target) + self._event(event))
+
+    def broadcast(self, time, event):
+        self._write(BROADCAST, time, self._event(event))
+
+    def deliver(self, time, target, event):
+        self._write(DELIVER, time, self._value(target) + self._event(event))
+
+    def interrupt(self, time, id, event):
+        self._write(INTERRUPT, time, self._value(id) + self._event(event))
+
+    def source_added(self, space, heat_source):
+        self._source(ADD, space, heat_source)
+
+    def source_removed(self, space, heat_source):
+        self._source(REMOVE, space, heat_source)
+
+    def source_output(self, space, heat_source):
+        self._source(OUTPUT, space, heat_source)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _source(self, kind, space, heat_source): #private
+        output = space.heat_sources.get(heat_source)
+        self._write(kind, space.env.now,
+                    _UINT.pack(self._space_index(space)) +
+                    self._value(heat_source.id) + self._value(output))
+
+    def _space_index(self, space): #private
+        index = self._spaces.get(id(space))
+        if index is None:
+            index = self._spaces[id(space)] = len(self._spaces)
+        return index
+
+    def _write(self, kind, time, body): #private
+        self.file.write(_HEAD.pack(_CODES[kind], time) + body)
+        self.records += 1
+
+    def _event(self, event): #private
+        if isinstance(event, Event):
+            fields, form = event.fields(), 1
+        else:
+            fields, form = event, 0
+        return (_BYTE.pack(form) + _BYTE.pack(len(fields)) +
+                b''.join(self._value(value) for value in fields))
+
+    def _value(self, value): #private
+        if value is None:
+            return _BYTE.pack(_NONE)
+        if value is ANY:
+            return _BYTE.pack(_ANY)
+        if value is True or value is False:
+            return _BYTE.pack(_TRUE if value else _FALSE)
+        if isinstance(value, str):
+            return _BYTE.pack(_STR) + self._string(value)
+        if isinstance(value, int) and -2**63 <= value < 2**63:
+            return _BYTE.pack(_INT) + _LONG.pack(value)
+        if isinstance(value, float):
+            return _BYTE.pack(_FLOAT) + _DOUBLE.pack(value)
+        if type(value) in (tuple, list):
+            return (_BYTE.pack(_TUPLE if type(value) is tuple else _LIST) +
+                    _UINT.pack(len(value)) +
+                    b''.join(self._value(item) for item in value))
+        if type(value) is dict:
+            return (_BYTE.pack(_DICT) + _UINT.pack(len(value)) +
+                    b''.join(self._value(key) + self._value(item)
+                             for key, item in value.items()))
+        try:
+            pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            #recording must not stop the simulation
+            self.unpicklable += 1
+            return _BYTE.pack(_REPR) + self._string(repr(value))
+        return _BYTE.pack(_PICKLED) + _UINT.pack(len(pickled)) + pickled
+
+    def _string(self, value): #private
+        """Index of value in the string table, written on first use"""
+        index = self._strings.get(value)
+        if index is None:
+            index = self._strings[value] = len(self._strings)
+            encoded = value.encode('utf-8')
+            self.file.write(_BYTE.pack(_STRING) +
+                            _UINT.pack(len(encoded)) + encoded)
+        return _UINT.pack(index)
+
+
+def read_trace(path):
+    """Records of a trace as tuples:
+
+    (PUT | BROADCAST, time, event)
+    (GET | DELIVER, time, target, event)
+    (INTERRUPT, time, bacterium id, event)
+    (ADD | REMOVE | OUTPUT, time, space index, source id, output)
+
+    Pickled payloads are unpickled, which can run arbitrary code: only
+    read traces from a trusted source.
+    """
+    with open(path, 'rb') as stored:
+        data = stored.read()
+    if not data.startswith(MAGIC):
+        raise ValueError('read_trace(): %s is not a trace' % path)
+    reader = _Reader(data, len(MAGIC))
+    records = []
+    while reader.offset < len(data):
+        code = reader.unpack(_BYTE)
+        if code == _STRING:
+            length = reader.unpack(_UINT)
+            reader.strings.append(
+                data[reader.offset:reader.offset + length].decode('utf-8'))
+            reader.offset += length
+            continue
+        kind = _TYPES[code]
+        time = reader.unpack(_DOUBLE)
+        if kind in (PUT, BROADCAST):
+            records.append((kind, time, reader.event()))
+        elif kind in (GET, INTERRUPT, DELIVER):
+            records.append((kind, time, reader.value(), reader.event()))
+        else:
+            records.append((kind, time, reader.unpack(_UINT), reader.value(),
+                            reader.value()))
+    return records
+
+
+class _Reader(object):
+    """Decoding state of read_trace()"""
+
+    def __init__(self, data, offset):
+        self.data = data
+        self.offset = offset
+        self.strings = []
+
+    def unpack(self, packer):
+        value = packer.unpack_from(self.data, self.offset)[0]
+        self.offset += packer.size
+        return value
+
+    def value(self):
+        tag = self.unpack(_BYTE)
+        if tag == _STR:
+            return self.strings[self.unpack(_UINT)]
+        if tag == _FLOAT:
+            return self.unpack(_DOUBLE)
+        if tag == _INT:
+            return self.unpack(_LONG)
+        if tag in (_TUPLE, _LIST):
+            items = [self.value() for _ in range(self.unpack(_UINT))]
+            return tuple(items) if tag == _TUPLE else items
+        if tag == _DICT:
+            return dict((self.value(), self.value())
+                        for _ in range(self.unpack(_UINT)))
+        if tag == _PICKLED:
+            length = self.unpack(_UINT)
+            self.offset += length
+            return pickle.loads(self.data[self.offset - length:self.offset])
+        if tag == _REPR:
+            return self.strings[self.unpack(_UINT)]
+        return {_NONE: None, _ANY: ANY, _TRUE: True, _FALSE: False}[tag]
+
+    def event(self):
+        form = self.unpack(_BYTE)
+        fields = [self.value() for _ in range(self.unpack(_BYTE))]
+        return Event(*fields) if form == 1 else tuple(fields)
+
+
+class _ReplayedSource(object):
+    """Stands in for a recorded heat source that is not being replayed"""
+
+    def __init__(self, id):
+        self.id = id
+        self.heat_output = 0
+        self.heat_on = False
+
+    def set_listener_callback(self, callable):
+        pass
+
+
+class Replay(object):
+    """Applies the puts, broadcasts, deliveries and heat source changes
+    of a trace to a colony.
+
+    Heat sources found among bacteria (by id) are added to and removed
+    from spaces (by index, in the order given to TraceRecorder.attach) as
+    recorded; their output follows from the events they handle. Other
+    recorded sources are replaced by stand-ins whose recorded output
+    changes are replayed too. Puts, broadcasts and deliveries are replayed
+    on event_stream, only those of kinds if given. Like read_trace(), only
+    for records of a trusted trace.
+    """
+
+    def __init__(self, env, records, event_stream=None, spaces=(),
+                 bacteria=(), kinds=None):
+        self.env = env
+        self.events = event_stream
+        self.spaces = list(spaces)
+        self.bacteria = dict((cb.id, cb) for cb in bacteria)
+        self._stand_ins = {}  # source id -> _ReplayedSource
+        self.schedule = [record for record in records
+                         if self._replayed(record, kinds)]
+        self.applied = 0
+        self._schedule_next()
+
+    def _replayed(self, record, kinds): #private
+        kind = record[0]
+        if kind in (PUT, BROADCAST, DELIVER):
+            return (self.events is not None and
+                    (kinds is None or kind_of(record[-1]) in kinds))
+        if kind in (ADD, REMOVE, OUTPUT):
+            if record[2] >= len(self.spaces):
+                return False
+            return kind != OUTPUT or record[3] not in self.bacteria
+        return False
+
+    def _schedule_next(self): #private
+        if self.applied < len(self.schedule):
+            delay = max(self.schedule[self.applied][1] - self.env.now, 0)
+            self.env.timeout(delay).callbacks.append(self._fire)
+
+    def _fire(self, event): #private
+        now = self.env.now
+        while (self.applied < len(self.schedule) and
+               self.schedule[self.applied][1] <= now):
+            self._apply(self.schedule[self.applied])
+            self.applied += 1
+        self._schedule_next()
+
+    def _apply(self, record): #private
+        kind = record[0]
+        if kind == PUT:
+            self.events.put(record[2])
+            return
+        if kind == BROADCAST:
+            self.events.broadcast(record[2])
+            return
+        if kind == DELIVER:
+            self.events.deliver(record[3], record[2])
+            return
+        space, id, output = self.spaces[record[2]], record[3], record[4]
+        source = self.bacteria.get(id)
+        if source is None:
+            source = self._stand_ins.get(id)
+            if source is None:
+                source = self._stand_ins[id] = _ReplayedSource(id)
+            source.heat_output = output or 0
+            source.heat_on = bool(output)
+        if kind == ADD:
+            space.add_heat_source(source)
+        elif kind == REMOVE:
+            space.remove_heat_source(source)
+        else:
+            space.heat_source_output_changed(source)
+
+
+def diff_traces(first, second, kinds=(INTERRUPT,)):
+    """First pair of differing records of the given kinds in two lists of
+    records, None if they match. Events are compared by their fields."""
+    first = [record for record in first if record[0] in kinds]
+    second = [record for record in second if record[0] in kinds]
+    for index, (a, b) in enumerate(zip(first, second)):
+        if _comparable(a) != _comparable(b):
+            return index, a, b
+    if len(first) != len(second):
+        index = min(len(first), len(second))
+        return (index, first[index] if index < len(first) else None,
+                second[index] if index < len(second) else None)
+    return None
+
+
+def _comparable(record): #private
+    return tuple(('Event',) + value.fields() if isinstance(value, Event)
+                 else value for value in record)
+
+
+def summary(records):
+    """Number of records per type and, for events, per kind"""
+    counts = Counter()
+    for record in records:
+        if record[0] in (PUT, GET, INTERRUPT, BROADCAST, DELIVER):
+            counts[(record[0], kind_of(record[-1]))] += 1
+        else:
+            counts[(record[0], None)] += 1
+    return counts
+
+
+def main(argv=None):
+    """Print a summary of the traces given on the command line"""
+    for path in (argv if argv is not None else sys.argv[1:]):
+        records = read_trace(path)
+        print('%s: %d records' % (path, len(records)))
+        for (kind, event_kind), count in sorted(summary(records).items(),
+                                                key=str):
+            print('  %-10s %-20s %8d' % (kind, event_kind or '', count))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,275 @@
+"""
+Declarative scenario files
+
+A scenario file describes rooms, heaters, thermometers and timed actions
+in JSON (or YAML, if PyYAML is installed):
+
+    {"until": 1000,
+     "space_model": "periodic",
+     "rooms": [{"id": "r1", "low_eq": 288, "start_temp": 290,
+                "volume": 75}],
+     "heaters": [{"id": "h1", "room": "r1", "output": 100}],
+     "thermometers": [{"id": "t1", "room": "r1", "period": 10}],
+     "actions": [[100, "add", "h1"],
+                 [300, "change", "h1"],
+                 [500, "output", "h1", 250],
+                 {"at": 800, "do": "remove", "heater": "h1"}]}
+
+space_model is "periodic" (ContainingSpace, the default) or "analytic"
+(AnalyticContainingSpace). Heaters take period (default 60) and
+event_kinds, thermometers period (default 20). With "relative_times": true
+the time of an action is the delay after the previous one, like in the
+action lists of the test scripts.
+
+Actions are [time, action, heater] lists (plus a value for "output"), or
+objects with at, do, heater and value:
+
+- add / remove: add the heater to (remove it from) its room and turn it on
+  (off) with a heat_on (heat_off) event
+- change: toggle the heater with a heat_on or heat_off event, going by
+  the state the earlier actions put it in (so two changes at the same
+  time turn it on and off again)
+- on / off: send the heater a heat_on / heat_off event
+- output: set the heat output of the heater to value
+
+compile_actions() turns the actions into a Schedule: four typed arrays
+(times, action codes, heater indexes, values) sorted by time, with no
+object per action. A single ScheduleDriver process walks it and applies
+all the actions of a timestamp in one batch, sending each heater the same
+two heat_on/heat_off event objects.
+
+    facility = load_facility(env, 'facility.json')
+    env.run(until=facility.until)
+    print(facility.results())
+
+"""
+
+from array import array
+import json
+
+from .cb_containingspace import ContainingSpace, AnalyticContainingSpace
+from .cb_event import Event
+from .cb_eventbus import EventBus
+from .cb_heater import CbHeater
+from .cb_thermometer import CbThermometer
+
+#action codes
+ADD = 0
+REMOVE = 1
+CHANGE = 2
+ON = 3
+OFF = 4
+OUTPUT = 5
+ACTIONS = {'add': ADD, 'remove': REMOVE, 'change': CHANGE, 'on': ON,
+           'off': OFF, 'output': OUTPUT}
+
+SPACE_MODELS = {
+    'periodic': ContainingSpace,
+    'analytic': AnalyticContainingSpace,
+}
+HEATER_EVENT_KINDS = ['ping', 'heat_on', 'heat_off']
+
+
+class Schedule(object):
+    """Actions sorted by time, as parallel typed arrays"""
+
+    def __init__(self, times, actions, heaters, values):
+        self.times = times      # array('d')
+        self.actions = actions  # array('B') of action codes
+        self.heaters = heaters  # array('I') of heater indexes
+        self.values = values    # array('d'), for OUTPUT
+
+    def __len__(self):
+        return len(self.times)
+
+    def batches(self):
+        """(time, first, end) of the actions of each timestamp"""
+        times = self.times
+        first = 0
+        while first < len(times):
+            end = first + 1
+            while end < len(times) and times[end] == times[first]:
+                end += 1
+            yield times[first], first, end
+            first = end
+
+
+def compile_actions(actions, heater_index, relative_times=False):
+    """Schedule of a list of actions; heater_index maps heater ids to
+    indexes"""
+    times = array('d')
+    codes = array('B')
+    heaters = array('I')
+    values = array('d')
+    clock = 0.0
+    for action in actions:
+        if isinstance(action, dict):
+            time = action['at']
+            name = action['do']
+            heater = action['heater']
+            value = action.get('value', 0.0)
+        else:
+            time, name, heater = action[0], action[1], action[2]
+            value = action[3] if len(action) > 3 else 0.0
+        if relative_times:
+            clock += time
+            time = clock
+        try:
+            codes.append(ACTIONS[name])
+            heaters.append(heater_index[heater])
+        except KeyError as error:
+            raise ValueError('compile_actions(): unknown action or heater %s'
+                             % error)
+        times.append(time)
+        values.append(value)
+    if any(times[i] > times[i + 1] for i in range(len(times) - 1)):
+        #stable, so actions at the same time keep their order
+        order = sorted(range(len(times)), key=times.__getitem__)
+        times = array('d', (times[i] for i in order))
+        codes = array('B', (codes[i] for i in order))
+        heaters = array('I', (heaters[i] for i in order))
+        values = array('d', (values[i] for i in order))
+    return Schedule(times, codes, heaters, values)
+
+
+class ScheduleDriver(object):
+    """Applies a Schedule to heaters (indexed like the schedule) in one
+    process, one batch per timestamp.
+
+    intended keeps the state each heater is meant to be in after the
+    actions applied so far (starting from its heat_on): a change toggles
+    that state rather than heat_on, which the heater only updates once it
+    has handled the events already sent. Every heater has one heat_on and
+    one heat_off event, created with the driver and stamped with the time
+    each time they are sent, so the events do not grow with the schedule.
+    """
+
+    def __init__(self, env, schedule, heaters, event_stream):
+        self.env = env
+        self.schedule = schedule
+        self.heaters = heaters
+        self.events = event_stream
+        self.intended = [heater.heat_on for heater in heaters]
+        #(heat_off, heat_on) event of each heater
+        self.heat_events = [(Event('heat_off', heater.id, env.now),
+                             Event('heat_on', heater.id, env.now))
+                            for heater in heaters]
+        self.applied = 0
+        self.process = env.process(self.driving())
+
+    def next_time(self):
+        """Time of the next actions to apply, None when all are done"""
+        if self.applied < len(self.schedule):
+            return self.schedule.times[self.applied]
+        return None
+
+    def driving(self):
+        for time, first, end in self.schedule.batches():
+            if time > self.env.now:
+                yield self.env.timeout(time - self.env.now)
+            for i in range(first, end):
+                self._apply(i)
+            self.applied = end
+
+    def _apply(self, i): #private
+        action = self.schedule.actions[i]
+        index = self.schedule.heaters[i]
+        heater = self.heaters[index]
+        if action == ADD:
+            heater.context.add_heat_source(heater)
+            heat_on = True
+        elif action == REMOVE:
+            heater.context.remove_heat_source(heater)
+            heat_on = False
+        elif action == CHANGE:
+            heat_on = not self.intended[index]
+        elif action == ON:
+            heat_on = True
+        elif action == OFF:
+            heat_on = False
+        else:
+            heater.heat_output = self.schedule.values[i]
+            if heater.listener_callback is not None:
+                heater.listener_callback(heater)
+            return
+        self.intended[index] = heat_on
+        event = self.heat_events[index][heat_on]
+        event.timestamp = self.env.now
+        self.events.put(event)
+
+
+class Facility(object):
+    """The rooms and bacteria of a scenario, set up in an environment.
+    Thermometers can share a scheduler (cb_scheduler.TickScheduler) and
+    store their readings in a recorder (cb_recorder.TemperatureRecorder)."""
+
+    def __init__(self, env, spec, scheduler=None, recorder=None):
+        self.env = env
+        self.until = spec.get('until')
+        space_model = spec.get('space_model', 'periodic')
+        if space_model not in SPACE_MODELS:
+            raise ValueError('Facility: unknown space model %s' % space_model)
+        cls = SPACE_MODELS[space_model]
+        self.event_queue = EventBus(env, spec.get('broadcast_kinds', ['ping']))
+        self.rooms = {}
+        for room in spec.get('rooms', ()):
+            self.rooms[room['id']] = cls(env, room.get('low_eq', 288),
+                                         room.get('start_temp', 290),
+                                         room.get('volume', 5*5*3))
+        self.heaters = []
+        heater_index = {}
+        for heater in spec.get('heaters', ()):
+            heater_index[heater['id']] = len(self.heaters)
+            self.heaters.append(CbHeater(
+                env, heater['id'], self._room(heater), self.event_queue,
+                heater.get('event_kinds', HEATER_EVENT_KINDS),
+                heater.get('period', 60), heater['output']))
+        self.thermometers = [
+            CbThermometer(env, thermometer['id'], self._room(thermometer),
+                          self.event_queue,
+                          thermometer.get('event_kinds', ['ping']),
+                          thermometer.get('period', 20),
+                          recorder=recorder, scheduler=scheduler)
+            for thermometer in spec.get('thermometers', ())]
+        self.schedule = compile_actions(spec.get('actions', ()), heater_index,
+                                        spec.get('relative_times', False))
+        self.driver = ScheduleDriver(env, self.schedule, self.heaters,
+                                     self.event_queue)
+
+    def _room(self, bacterium): #private
+        try:
+            return self.rooms[bacterium['room']]
+        except KeyError:
+            raise ValueError('Facility: %s is in unknown room %s'
+                             % (bacterium['id'], bacterium.get('room')))
+
+    def results(self):
+        return {'now': self.env.now,
+                'actions': self.driver.applied,
+                'rooms': dict((id, room.current_temperature())
+                              for id, room in self.rooms.items()),
+                'heaters_on': sorted(heater.id for heater in self.heaters
+                                     if heater.heat_on)}
+
+
+def read_spec(path):
+    """Scenario dict of a JSON or YAML (.yaml, .yml) file"""
+    with open(path) as stored:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError('read_spec(): reading %s needs PyYAML'
+                                   % path)
+            return yaml.safe_load(stored)
+        return json.load(stored)
+
+
+def load_facility(env, path, scheduler=None, recorder=None):
+    return Facility(env, read_spec(path), scheduler, recorder)
+
+
+def facility_scenario(env, rng, path):
+    """cb_sweep scenario running a scenario file"""
+    facility = load_facility(env, path)
+    return facility.results
@@ -0,0 +1,139 @@
+"""
+Shared timer for periodic bacteria
+
+Without a scheduler every CbBase runs its own acting process and puts one
+timeout on the simpy event heap per bacterium and cycle. A TickScheduler
+groups bacteria by the time of their next sustenance activity: bacteria
+with the same period and phase share a bucket, and the buckets are woken
+in time order by a single timeout, set for the earliest one, that calls
+sustain() on all of its members in one batch and moves them on to the
+bucket one period later. The scheduler never has more than one timeout
+pending, so fast_forward() leaves at most one stale timeout behind (which
+is ignored when it fires) instead of one per skipped bucket.
+
+An interrupt keeps the remaining-sleep adjustment of CbBase.acting: after
+handling an event the bacterium sleeps for its period minus the time
+already slept, and only moves to another bucket if that changes its wake
+up time.
+
+    scheduler = TickScheduler(env)
+    tmeter = CbThermometer(env, 't1', room, event_queue, ['ping'], 20,
+                           scheduler=scheduler)
+
+"""
+
+from collections import OrderedDict
+import heapq
+import math
+
+from .cb_trace import get_tracer
+
+_trace = get_tracer('scheduler')
+
+#an interrupt only moves a bacterium to another bucket if its wake up time
+#changes by more than this; buckets are keyed by the exact wake up time
+EPSILON = 1e-9
+
+
+class TickScheduler(object):
+
+    def __init__(self, env):
+        self.env = env
+        self.buckets = {}  # wake up time -> OrderedDict of bacteria
+        self._due = {}     # bacterium -> its wake up time
+        self._times = []   # heap of bucket wake up times, stale ones too
+        self._timer = None      # the pending timeout
+        self._timer_due = None  # ...and the wake up time it is set for
+        self.ticks = 0     # buckets woken
+
+    def add(self, cb):
+        """Start the periodic activity of cb: first wake up after its
+        sleep_time_left"""
+        cb.sleep_starts_at = self.env.now
+        self._schedule(cb, self.env.now + cb.sleep_time_left)
+
+    def remove(self, cb):
+        due = self._due.pop(cb, None)
+        if due is not None:
+            self.buckets[due].pop(cb, None)
+
+    def interrupted(self, cb):
+        """Adjust the wake up time of cb after it handled an event"""
+        cb.sleep_time_left = cb.period - (self.env.now - cb.sleep_starts_at)
+        cb.sleep_starts_at = self.env.now
+        _trace.debug('sleep_time_left %d', cb.sleep_time_left)
+        old_due = self._due.get(cb)
+        if old_due is None:
+            return  # removed, but still listening
+        due = self.env.now + cb.sleep_time_left
+        if abs(due - old_due) > EPSILON:
+            self.remove(cb)
+            self._schedule(cb, due)
+
+    def fast_forward(self, until):
+        """Move the bacteria due before until on to their first wake up
+        time at or after it, as if they had woken up in between. Returns
+        (bacterium, first skipped wake up, number skipped) for each."""
+        skipped = []
+        for due in sorted(due for due in self.buckets if due < until):
+            bucket = self.buckets.pop(due)
+            for cb in bucket:
+                del self._due[cb]
+                count = int(math.ceil((until - due) / cb.period))
+                wake_up = due + count * cb.period
+                cb.sleep_starts_at = wake_up - cb.period
+                cb.sleep_time_left = cb.period
+                self._schedule(cb, wake_up)
+                skipped.append((cb, due, count))
+        if skipped:
+            self._set_timer()  # the old one was for a skipped bucket
+        return skipped
+
+    def _schedule(self, cb, due): #private
+        bucket = self.buckets.get(due)
+        if bucket is None:
+            bucket = self.buckets[due] = OrderedDict()
+            heapq.heappush(self._times, due)
+            if self._timer_due is None or due < self._timer_due:
+                self._set_timer()
+        bucket[cb] = None
+        self._due[cb] = due
+
+    def _set_timer(self): #private
+        """Set the timeout for the earliest bucket, dropping the wake up
+        times of buckets that are gone"""
+        times = self._times
+        while times and times[0] not in self.buckets:
+            heapq.heappop(times)
+        if not times:
+            self._timer = self._timer_due = None
+            return
+        if times[0] == self._timer_due:
+            return
+        self._timer_due = times[0]
+        self._timer = self.env.timeout(self._timer_due - self.env.now)
+        self._timer.callbacks.append(self._tick)
+
+    def _tick(self, timer): #private
+        if timer is not self._timer:
+            return  # set for a bucket skipped or woken since
+        #keep _schedule from setting timers while the buckets are woken
+        self._timer_due = self.env.now
+        times = self._times
+        while times and times[0] <= self.env.now:
+            self._fire(heapq.heappop(times))
+        self._timer = self._timer_due = None
+        self._set_timer()
+
+    def _fire(self, due): #private
+        bucket = self.buckets.pop(due, None)
+        if not bucket:
+            return
+        self.ticks += 1
+        for cb in bucket:
+            del self._due[cb]
+        for cb in bucket:
+            cb.sustain()
+            cb.sleep_starts_at = self.env.now
+            cb.sleep_time_left = cb.period
+            self._schedule(cb, due + cb.period)
@@ -0,0 +1,301 @@
+"""
+Sharded execution of a building on several processes
+
+A building is a list of rooms, each a ContainingSpace with its own
+EventBus, heater and thermometer. Rooms only talk to each other through
+posts: an event a room posts to another room at time t is put on the bus
+of that room at t + lookahead.
+
+run_sharded() partitions the rooms over worker processes, each with an
+environment of its own. The workers advance in lockstep windows of
+simulated time. At each window boundary the coordinator collects the
+posts of the window from every worker over a pipe and hands them to the
+workers holding the receiving rooms. As the lookahead is at least the
+window length, nothing posted during a window is due before the window
+ends, so no worker ever needs to go back in time.
+
+run_single() runs the same building in one process, with the same
+windows and the same way of scheduling posts, so both give exactly the
+same results for the same seed:
+
+- every room draws its random numbers from its own random.Random, seeded
+  from the seed and the room index
+- posts are delivered in a fixed order (due time, time posted, sending
+  room, sequence number within that room)
+- inside a room, events at the same time keep their order whatever other
+  rooms share the environment
+
+The window and the lookahead are part of the model: changing them can
+change the results, changing the number of shards cannot.
+
+Command line:
+    python -m v2.cb_shard --rooms 64 --shards 4 --until 3600 --check
+
+"""
+
+import argparse
+import hashlib
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import simpy
+
+from .cb_containingspace import ContainingSpace
+from .cb_event import Event
+from .cb_eventbus import EventBus
+from .cb_heater import CbHeater
+from .cb_thermometer import CbThermometer
+
+RANDOM_SEED = 42
+SIM_TIME = 3600   # seconds
+WINDOW = 10       # seconds of simulated time between exchanges
+LOOKAHEAD = 10    # delay of posts between rooms, at least WINDOW
+
+
+class ThermostatRoom(object):
+    """A room with a heater, a thermometer and a thermostat. The
+    thermostat posts its readings to the next room and also takes the
+    readings of the previous room into account."""
+
+    def __init__(self, env, index, rooms, rng, post):
+        self.env = env
+        self.index = index
+        self.post = post
+        self.next_room = (index + 1) % rooms
+        self.space = ContainingSpace(env, 288, rng.uniform(286, 292),
+                                     rng.choice([75, 150]))
+        self.bus = EventBus(env)
+        self.heater = CbHeater(env, 'heater%d' % index, self.space, self.bus,
+                               ['heat_on', 'heat_off'], 60,
+                               rng.choice([300, 500, 800]))
+        self.space.add_heat_source(self.heater)
+        CbThermometer(env, 'thermometer%d' % index, self.space, self.bus,
+                      [], 20)
+        self.setpoint = rng.uniform(289, 293)
+        self.own = None
+        self.neighbour = None
+        self.switches = 0
+        env.process(self.thermostat())
+
+    def deliver(self, event):
+        """Put an event posted by another room"""
+        self.bus.put(event)
+
+    def thermostat(self):
+        while True:
+            event = yield self.bus.get(['temp_measurement', 'neighbour_temp'])
+            if event.kind == 'temp_measurement':
+                self.own = event.payload
+                self.post(self.next_room,
+                          Event('neighbour_temp', None, self.env.now,
+                                event.payload, self.index))
+            else:
+                self.neighbour = event.payload
+            if self.own is None:
+                continue
+            temperature = (self.own if self.neighbour is None else
+                           (3 * self.own + self.neighbour) / 4)
+            if temperature < self.setpoint and not self.heater.heat_on:
+                self.switches += 1
+                self.bus.put(Event('heat_on', self.heater.id, self.env.now))
+            elif temperature > self.setpoint + 0.5 and self.heater.heat_on:
+                self.switches += 1
+                self.bus.put(Event('heat_off', self.heater.id, self.env.now))
+
+    def result(self):
+        return {'room': self.index,
+                'temperature': self.space.current_temperature(),
+                'heat_on': self.heater.heat_on,
+                'switches': self.switches}
+
+
+def room_seed(seed, index):
+    digest = hashlib.sha256(('%s:room%d' % (seed, index)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class Shard(object):
+    """Some rooms of a building in one environment"""
+
+    def __init__(self, room_indexes, rooms, seed=RANDOM_SEED,
+                 lookahead=LOOKAHEAD, room_class=ThermostatRoom):
+        self.env = simpy.Environment()
+        self.lookahead = lookahead
+        self.outbox = []
+        self._posted = {}  # room index -> posts sent so far
+        self.rooms = {}
+        for index in room_indexes:
+            self.rooms[index] = room_class(
+                self.env, index, rooms, random.Random(room_seed(seed, index)),
+                self._poster(index))
+
+    def _poster(self, index): #private
+        self._posted[index] = 0
+
+        def post(to, event):
+            sent = self._posted[index]
+            self._posted[index] = sent + 1
+            self.outbox.append((self.env.now + self.lookahead, self.env.now,
+                                index, sent, to, event))
+        return post
+
+    def advance(self, until, inbound=()):
+        """Schedule the posts inbound for our rooms, run until the end of
+        the window and return the posts sent during it"""
+        for post in sorted(inbound, key=_post_order):
+            due, to, event = post[0], post[4], post[5]
+            if due < self.env.now:
+                raise RuntimeError('Shard.advance(): post due at %s arrived '
+                                   'at %s, lookahead shorter than the window'
+                                   % (due, self.env.now))
+            delivery = self.env.timeout(due - self.env.now)
+            delivery.callbacks.append(
+                lambda _, room=self.rooms[to], event=event:
+                room.deliver(event))
+        self.env.run(until=until)
+        outbox, self.outbox = self.outbox, []
+        return outbox
+
+    def results(self):
+        return [self.rooms[index].result() for index in sorted(self.rooms)]
+
+
+def _post_order(post):
+    """due time, time posted, sending room, sequence number"""
+    return post[:4]
+
+
+def windows(until, window):
+    end = 0
+    while end < until:
+        end = min(end + window, until)
+        yield end
+
+
+def run_single(rooms, until=SIM_TIME, window=WINDOW, lookahead=LOOKAHEAD,
+               seed=RANDOM_SEED, room_class=ThermostatRoom):
+    """Run the building in this process; returns the room results"""
+    _check(window, lookahead)
+    shard = Shard(range(rooms), rooms, seed, lookahead, room_class)
+    inbound = []
+    for end in windows(until, window):
+        inbound = shard.advance(end, inbound)
+    return shard.results()
+
+
+def run_sharded(rooms, shards, until=SIM_TIME, window=WINDOW,
+                lookahead=LOOKAHEAD, seed=RANDOM_SEED,
+                room_class=ThermostatRoom):
+    """Run the building on shards worker processes; returns the room
+    results, ordered by room"""
+    _check(window, lookahead)
+    shards = max(1, min(shards, rooms))
+    owner = dict((index, index % shards) for index in range(rooms))
+    pipes = []
+    workers = []
+    for shard in range(shards):
+        parent, child = multiprocessing.Pipe()
+        worker = multiprocessing.Process(
+            target=_worker,
+            args=(child, [i for i in range(rooms) if owner[i] == shard],
+                  rooms, seed, lookahead, room_class))
+        worker.start()
+        child.close()
+        pipes.append(parent)
+        workers.append(worker)
+    try:
+        inbound = [[] for _ in range(shards)]
+        for end in windows(until, window):
+            for shard, pipe in enumerate(pipes):
+                pipe.send(('advance', end, inbound[shard]))
+            inbound = [[] for _ in range(shards)]
+            for pipe in pipes:
+                for post in _receive(pipe):
+                    inbound[owner[post[4]]].append(post)
+        results = []
+        for pipe in pipes:
+            pipe.send(('results',))
+            results.extend(_receive(pipe))
+    finally:
+        #workers forked later hold copies of the earlier pipes, so they are
+        #told to stop rather than left waiting for the pipes to close
+        for pipe in pipes:
+            try:
+                pipe.send(('stop',))
+            except (BrokenPipeError, OSError):
+                pass
+            pipe.close()
+        for worker in workers:
+            worker.join()
+    return sorted(results, key=lambda result: result['room'])
+
+
+def _check(window, lookahead): #private
+    if lookahead < window:
+        raise ValueError('lookahead %s is shorter than the window %s'
+                         % (lookahead, window))
+
+
+def _receive(pipe): #private
+    reply = pipe.recv()
+    if isinstance(reply, Exception):
+        raise reply
+    return reply
+
+
+def _worker(pipe, room_indexes, rooms, seed, lookahead, room_class): #private
+    try:
+        shard = Shard(room_indexes, rooms, seed, lookahead, room_class)
+        while True:
+            try:
+                request = pipe.recv()
+            except EOFError:
+                return
+            if request[0] == 'advance':
+                pipe.send(shard.advance(request[1], request[2]))
+            elif request[0] == 'results':
+                pipe.send(shard.results())
+            else:
+                return
+    except Exception as error:
+        pipe.send(error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a sharded building')
+    parser.add_argument('--rooms', type=int, default=64)
+    parser.add_argument('--shards', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--until', type=float, default=SIM_TIME)
+    parser.add_argument('--window', type=float, default=WINDOW)
+    parser.add_argument('--lookahead', type=float, default=LOOKAHEAD)
+    parser.add_argument('--seed', type=int, default=RANDOM_SEED)
+    parser.add_argument('--check', action='store_true',
+                        help='compare with a single process run')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    results = run_sharded(args.rooms, args.shards, args.until, args.window,
+                          args.lookahead, args.seed)
+    print('%d rooms on %d shards: %.2f s' %
+          (args.rooms, args.shards, time.perf_counter() - started),
+          file=sys.stderr)
+    status = 0
+    if args.check:
+        started = time.perf_counter()
+        single = run_single(args.rooms, args.until, args.window,
+                            args.lookahead, args.seed)
+        print('single process: %.2f s, results %s' %
+              (time.perf_counter() - started,
+               'match' if single == results else 'DIFFER'), file=sys.stderr)
+        status = 0 if single == results else 1
+    for result in results:
+        print(json.dumps(result))
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Parameter sweeps over independent simulation runs
+
+A scenario is a function scenario(env, rng, **params) that sets up rooms
+and bacteria in the given simpy environment and returns a function that
+collects the results (a dict) once the run is over. sweep() runs the
+scenario for every point of a parameter grid, each in its own environment,
+spread over a pool of worker processes, and yields one SweepRecord per run
+as soon as it is done.
+
+Every run gets its own random.Random, seeded from the base seed and the
+index of the point in the grid, so a sweep gives the same results whatever
+the number of processes or the order in which runs finish. 'seed' is a
+reserved axis for running every point with several seeds: a point is run
+once per seed value, seeded from that value (instead of the base seed)
+and the index of the point in the rest of the grid, so seed=42 reproduces
+the run of a sweep with base seed 42.
+
+Scenarios (SCENARIOS):
+
+- room: heaters toggled at random times (room_scenario)
+- heat_sources: test_case_1 of cb_containingspace_test, three heaters
+  added, toggled and removed (heat_sources_scenario)
+- heater_cycle: test_case_2 of cb_containingspace_test, one heater turned
+  on and off again (heater_cycle_scenario)
+- colony: the prototype colony of main.py (colony_scenario)
+- facility: a scenario file (cb_scenario)
+
+Command line:
+    python -m v2.cb_sweep room --grid volume=75,150 --grid heater_output=100,300
+        --processes 4 --seed 42 --out results.jsonl
+    python -m v2.cb_sweep room --grid seed=1,2,3,4
+
+"""
+
+from collections import namedtuple
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import random
+import sys
+import time
+
+import simpy
+
+from .cb_containingspace import ContainingSpace
+from .cb_event import Event
+from .cb_eventbus import EventBus
+from .cb_heater import CbHeater
+from .cb_recorder import TemperatureRecorder
+from .cb_scenario import Facility, facility_scenario
+from .cb_thermometer import CbThermometer
+
+RANDOM_SEED = 42
+SIM_TIME = 1000  # seconds
+
+SweepRecord = namedtuple('SweepRecord',
+                         'index seed params result wall_time')
+
+
+def parameter_grid(grid):
+    """All combinations of a dict of parameter name -> list of values, as
+    dicts, in a fixed order"""
+    names = sorted(grid)
+    for values in itertools.product(*(grid[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def run_seed(base_seed, index):
+    """Seed of the run at index of a sweep"""
+    digest = hashlib.sha256(('%s:%d' % (base_seed, index)).encode()).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+def run_point(scenario, index, params, seed):
+    """Run scenario once in a fresh environment and return its record.
+
+    The 'until' parameter, if any, is the simulated time of the run, and
+    the 'seed' parameter the one its seed came from; neither is passed on
+    to the scenario.
+    """
+    started = time.perf_counter()
+    params = dict(params)
+    until = params.pop('until', SIM_TIME)
+    base_seed = params.pop('seed', None)
+    env = simpy.Environment()
+    results = scenario(env, random.Random(seed), **params)
+    env.run(until=until)
+    params['until'] = until
+    if base_seed is not None:
+        params['seed'] = base_seed
+    return SweepRecord(index, seed, params, results(),
+                       time.perf_counter() - started)
+
+
+def _run_task(task): #private
+    return run_point(*task)
+
+
+def sweep_points(grid, base_seed=RANDOM_SEED):
+    """(index, params, seed) of every run of a sweep over grid"""
+    points = dict((name, values) for name, values in grid.items()
+                  if name != 'seed')
+    seeds = grid.get('seed', [None])
+    index = 0
+    for point, params in enumerate(parameter_grid(points)):
+        for seed in seeds:
+            if seed is None:
+                yield index, params, run_seed(base_seed, point)
+            else:
+                yield (index, dict(params, seed=seed),
+                       run_seed(seed, point))
+            index += 1
+
+
+def sweep(scenario, grid, processes=None, base_seed=RANDOM_SEED):
+    """Run scenario for every point of grid and yield the records in the
+    order the runs finish. processes=1 runs everything in this process."""
+    tasks = ((scenario, index, params, seed)
+             for index, params, seed in sweep_points(grid, base_seed))
+    if processes == 1:
+        for task in tasks:
+            yield _run_task(task)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        for record in pool.imap_unordered(_run_task, tasks):
+            yield record
+
+
+############
+## Scenarios
+##
+
+def room_scenario(env, rng, volume=5*5*3, heater_output=300, heaters=1,
+                  period=20, low_eq=288, start_temp=290, toggles=4):
+    """A room with heaters that are turned on and off at random times, and
+    one thermometer reading the temperature every period seconds"""
+    room = ContainingSpace(env, low_eq, start_temp, volume)
+    event_queue = EventBus(env)
+    heater_list = []
+    for i in range(heaters):
+        heater = CbHeater(env, 'heater%d' % i, room, event_queue,
+                          ['ping', 'heat_on', 'heat_off'], 60, heater_output)
+        room.add_heat_source(heater)
+        heater_list.append(heater)
+    tmeter = CbThermometer(env, 'thermometer1', room, event_queue, ['ping'],
+                           period)
+    readings = []
+
+    def toggling():
+        for _ in range(toggles):
+            yield env.timeout(rng.uniform(50, 300))
+            heater = rng.choice(heater_list)
+            kind = 'heat_off' if heater.heat_on else 'heat_on'
+            yield event_queue.put(Event(kind, heater.id, env.now))
+
+    def temp_listener():
+        while True:
+            event = yield event_queue.get(['temp_measurement'])
+            readings.append(event.payload)
+            if CbThermometer.event_pool is not None:
+                CbThermometer.event_pool.release(event)
+
+    env.process(toggling())
+    env.process(temp_listener())
+    return lambda: {'temperature': room.temperature,
+                    'max_reading': max(readings) if readings else None,
+                    'min_reading': min(readings) if readings else None,
+                    'readings': len(readings)}
+
+
+def _readings_scenario(env, spec): #private
+    """Set up the Facility of spec, its thermometers recording into a
+    TemperatureRecorder, and return its results function"""
+    recorder = TemperatureRecorder()
+    facility = Facility(env, spec, recorder=recorder)
+
+    def results():
+        results = facility.results()
+        for id in sorted(recorder.series):
+            values = recorder.values(id)
+            results[id] = {'readings': len(values), 'max': max(values),
+                           'min': min(values)}
+        return results
+    return results
+
+
+def heat_sources_scenario(env, rng, volume=5*5*3, outputs=(100, 300, 200),
+                          heater_period=10, period=10, low_eq=288,
+                          start_temp=290, space_model='periodic'):
+    """test_case_1 of cb_containingspace_test: three heaters added to a
+    room one after the other, the second one turned off again and the
+    first one removed"""
+    return _readings_scenario(env, {
+        'space_model': space_model,
+        'rooms': [{'id': 'room', 'low_eq': low_eq, 'start_temp': start_temp,
+                   'volume': volume}],
+        'heaters': [{'id': 'h%d' % (i + 1), 'room': 'room', 'output': output,
+                     'period': heater_period}
+                    for i, output in enumerate(outputs)],
+        'thermometers': [{'id': 't1', 'room': 'room', 'period': period}],
+        'relative_times': True,
+        'actions': [[100, 'add', 'h1'], [300, 'add', 'h2'],
+                    [600, 'change', 'h2'], [810, 'add', 'h3'],
+                    [90, 'remove', 'h1']]})
+
+
+def heater_cycle_scenario(env, rng, volume=5*5*3, heater_output=300,
+                          heater_period=60, period=20, low_eq=288,
+                          start_temp=290, on_at=100, on_for=300,
+                          space_model='periodic'):
+    """test_case_2 of cb_containingspace_test: a heater added and turned
+    on at on_at, and turned off on_for seconds later"""
+    return _readings_scenario(env, {
+        'space_model': space_model,
+        'rooms': [{'id': 'room', 'low_eq': low_eq, 'start_temp': start_temp,
+                   'volume': volume}],
+        'heaters': [{'id': 'heater1', 'room': 'room', 'output': heater_output,
+                     'period': heater_period}],
+        'thermometers': [{'id': 'thermometer1', 'room': 'room',
+                          'period': period}],
+        'actions': [[on_at, 'add', 'heater1'],
+                    [on_at + on_for, 'change', 'heater1']]})
+
+
+def colony_scenario(env, rng, context_period=20, event_period=71,
+                    period=10, sensors=1, actuators=1):
+    """The prototype colony of main.py: sensor and actuator bacteria
+    (compubact) sharing a cooling context, and a generator of tick events
+    alternating between sensors and actuators. Needs the repository root
+    on sys.path, like the prototype itself."""
+    from compubact import BacterialContext, ComputationalBacterium
+    from messaging import MessageDispatcher
+
+    context = BacterialContext(env, context_period)
+    event_queue = simpy.FilterStore(env)
+    dispatcher = MessageDispatcher()
+    bacteria = [ComputationalBacterium(env, 'cb_%d' % (i + 1), kind, period,
+                                       context, event_queue, dispatcher)
+                for i, kind in enumerate(['sensor'] * sensors +
+                                         ['actuator'] * actuators)]
+    generated = []
+
+    def event_generator():
+        #compubact.event_generator without the printing
+        while True:
+            yield env.timeout(event_period)
+            kind = 'sensor' if len(generated) % 2 == 0 else 'actuator'
+            generated.append(kind)
+            yield event_queue.put((kind, 'tick'))
+
+    env.process(event_generator())
+    return lambda: {'ambient_temperature': context.ambient_temperature,
+                    'bacteria': len(bacteria),
+                    'events': len(generated),
+                    'queued': len(event_queue.items)}
+
+
+SCENARIOS = {
+    'room': room_scenario,
+    'heat_sources': heat_sources_scenario,
+    'heater_cycle': heater_cycle_scenario,
+    'colony': colony_scenario,
+    'facility': facility_scenario,  # path=scenario file
+}
+
+
+def _parse_value(text): #private
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a parameter sweep')
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--grid', action='append', default=[],
+                        metavar='NAME=V1,V2,...',
+                        help='values of one parameter (repeatable)')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=RANDOM_SEED)
+    parser.add_argument('--until', type=float, default=SIM_TIME)
+    parser.add_argument('--out', default=None,
+                        help='JSON lines file (default: stdout)')
+    args = parser.parse_args(argv)
+
+    grid = {'until': [args.until]}
+    for item in args.grid:
+        name, _, values = item.partition('=')
+        grid[name] = [_parse_value(v) for v in values.split(',')]
+
+    out = open(args.out, 'w') if args.out else sys.stdout
+    try:
+        for record in sweep(SCENARIOS[args.scenario], grid, args.processes,
+                            args.seed):
+            out.write(json.dumps(record._asdict()) + '\n')
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+"""
+Vectorized temperature model for buildings with many rooms
+
+Same physics as ContainingSpace, but instead of one simpy process per room
+a ThermalEngine keeps the temperature, low equilibrium, volume and total
+heat output of every room in NumPy arrays and advances all of them in one
+vectorized step per update tick.
+
+Rooms are created with ThermalEngine.add_room(), which returns a Room: a
+per-room view that has the add_heat_source/remove_heat_source/
+heat_source_output_changed interface of ContainingSpace and a
+`temperature` attribute, so it can be the context of CbHeater and
+CbThermometer bacteria.
+
+A heat source change brings the temperature of that room alone up to date
+(with the output it had until now), like an interrupt of the duty cycle of
+a ContainingSpace. Updates happen on a fixed grid of cycle_length seconds
+for all rooms; a room created or changed in the middle of a cycle is
+advanced by the remaining part of the cycle at the next tick.
+
+Between updates the temperature attribute of the two differs: a
+ContainingSpace restarts its cycle when interrupted, and a second change
+at the same time restarts a full cycle, so its updates drift off the grid
+the engine keeps (e.g. heaters added at t=100 show up in the temperature
+of a ContainingSpace at t=160 rather than at the tick at t=120). The
+temperature brought up to the current time, current_temperature() of
+both, is the same.
+
+Rooms can exchange heat through walls and doors: couple(a, b, conductance)
+connects two rooms, and at every tick heat flows between them at
+conductance watts per kelvin of temperature difference, where a watt
+warms a room like a heat source of that output does. The couplings form a
+sparse network; the flows are computed with a scipy.sparse Laplacian
+matrix if SciPy is installed, or with NumPy over the list of couplings,
+so a tick costs O(rooms + couplings). Heat exchange is integrated with
+explicit steps over the whole cycle, after every room has been advanced
+on its own; the cycle is split into smaller steps if strong couplings
+need it to stay stable. Like a room on its own, a room losing heat to its
+neighbours never gets below its low equilibrium.
+
+"""
+
+import math
+
+import numpy as np
+try:
+    import scipy.sparse as sparse
+except ImportError:  # couplings are summed with NumPy instead
+    sparse = None
+
+from .cb_containingspace import UPDATE_FREQ, HeatSourceTotal, heat_output_of
+from .cb_trace import get_tracer
+
+_trace = get_tracer('engine')
+
+#K per minute for each watt flowing into a room, as for heat sources
+EXCHANGE_RATE = 0.1 / 100
+
+
+class ThermalEngine(object):
+
+    def __init__(self, env, update_freq=UPDATE_FREQ, capacity=64):
+        self.env = env
+        self.cycle_length = (1 / update_freq) * 60
+        self.count = 0                           # number of rooms
+        self.rooms = []
+        self.temperature = np.zeros(capacity)      # Kelvin
+        self.low_equilibrium = np.zeros(capacity)  # Kelvin
+        self.volume = np.zeros(capacity)           # cubic meter
+        self.heat_output = np.zeros(capacity)      # active output per room
+        self.last_update = np.zeros(capacity)      # time of last update
+        self.couplings = {}  # (room index, room index) -> watts per kelvin
+        self._network = None  # built from couplings when needed
+        self.duty_process = env.process(self.update())
+
+    def add_room(self, low_eq, start_temp, volume):
+        """Add a room to the building and return its Room view"""
+        if self.count == len(self.temperature):
+            self._grow()
+        index = self.count
+        self.temperature[index] = start_temp
+        self.low_equilibrium[index] = low_eq
+        self.volume[index] = volume
+        self.heat_output[index] = 0
+        self.last_update[index] = self.env.now
+        self.count += 1
+        self._network = None
+        room = Room(self, index)
+        self.rooms.append(room)
+        return room
+
+    def update(self): #private
+        """The duty cycle: advance every room at the end of each cycle"""
+        while True:
+            yield self.env.timeout(self.cycle_length)
+            self.advance(slice(0, self.count))
+            if self.couplings:
+                self.exchange(self.cycle_length)
+            _trace.debug('At %s: updated %d rooms', self.env.now, self.count)
+
+    def set_output(self, index, total_output):
+        """Bring room index up to date with its old heat output and then
+        switch it to total_output"""
+        self.advance(slice(index, index + 1))
+        self.heat_output[index] = total_output
+
+    def advance(self, rooms):
+        """Compute the temperature of rooms (a slice or an index array)
+        for the time passed since their last update"""
+        time_passed = self.env.now - self.last_update[rooms]
+        temperature = self.temperature[rooms]
+        total_output = self.heat_output[rooms]
+        low_eq = self.low_equilibrium[rooms]
+        eq_target = (total_output * self.volume[rooms] / 10000) + low_eq
+        #cooling rate is constant: 0.1K per minute, warming rate depends
+        #on heat output (rooms without heat output keep cooling down)
+        cooling = time_passed / 60 * 0.1
+        warming = np.where(total_output == 0, -cooling,
+                           time_passed / 60 * (total_output / 100 * 0.1))
+        #move towards the target, but not past it
+        temperature = np.where(
+            temperature > eq_target,
+            temperature - np.minimum(temperature - eq_target, cooling),
+            np.where(temperature < eq_target,
+                     temperature + np.minimum(eq_target - temperature, warming),
+                     temperature))
+        #...and never below the lowest possible temperature
+        self.temperature[rooms] = np.maximum(temperature, low_eq)
+        self.last_update[rooms] = self.env.now
+
+    def couple(self, a, b, conductance):
+        """Let rooms a and b (Room views or indexes) exchange heat at
+        conductance watts per kelvin (None or 0 to uncouple them)"""
+        a = getattr(a, 'index', a)
+        b = getattr(b, 'index', b)
+        if a == b:
+            raise ValueError('couple(): a room cannot be coupled to itself')
+        key = (min(a, b), max(a, b))
+        if conductance:
+            self.couplings[key] = conductance
+        else:
+            self.couplings.pop(key, None)
+        self._network = None
+
+    def exchange(self, time_span):
+        """Let heat flow through the couplings for time_span seconds"""
+        network = self._network or self._build_network()
+        steps = max(1, int(math.ceil(time_span * network.max_rate / 0.5)))
+        step = time_span / 60 / steps * EXCHANGE_RATE
+        temperature = self.temperature[:self.count]
+        low_eq = self.low_equilibrium[:self.count]
+        for _ in range(steps):
+            temperature += step * network.flow(temperature)
+            np.maximum(temperature, low_eq, out=temperature)
+
+    def _build_network(self): #private
+        self._network = _Network(self.count, self.couplings)
+        return self._network
+
+    def _grow(self): #private
+        capacity = 2 * len(self.temperature)
+        for name in ('temperature', 'low_equilibrium', 'volume',
+                     'heat_output', 'last_update'):
+            old = getattr(self, name)
+            new = np.zeros(capacity)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+class _Network(object):
+    """The couplings of a building as a sparse conductance matrix"""
+
+    def __init__(self, count, couplings):
+        self.count = count
+        pairs = np.array(list(couplings), dtype=np.intp).reshape(-1, 2)
+        self.first = pairs[:, 0]
+        self.second = pairs[:, 1]
+        self.conductance = np.array(list(couplings.values()), dtype=float)
+        degree = (np.bincount(self.first, self.conductance, count) +
+                  np.bincount(self.second, self.conductance, count))
+        #fastest relaxation, per second, of any room (for stable steps)
+        self.max_rate = (degree.max() if count else 0) * EXCHANGE_RATE / 60
+        self.laplacian = None
+        if sparse is not None:
+            rows = np.concatenate((self.first, self.second,
+                                   self.first, self.second))
+            columns = np.concatenate((self.second, self.first,
+                                      self.first, self.second))
+            values = np.concatenate((self.conductance, self.conductance,
+                                     -self.conductance, -self.conductance))
+            self.laplacian = sparse.coo_matrix(
+                (values, (rows, columns)), shape=(count, count)).tocsr()
+
+    def flow(self, temperature):
+        """Net heat flowing into each room, in watts"""
+        if self.laplacian is not None:
+            return self.laplacian.dot(temperature)
+        flow = self.conductance * (temperature[self.second] -
+                                   temperature[self.first])
+        return (np.bincount(self.first, flow, self.count) -
+                np.bincount(self.second, flow, self.count))
+
+
+class Room(HeatSourceTotal):
+    """View of one room of a ThermalEngine, usable wherever a
+    ContainingSpace is used as the context of bacteria"""
+
+    def __init__(self, engine, index):
+        self.engine = engine
+        self.index = index
+        #heat output each source contributes, keyed by the source itself
+        self.heat_sources = {}
+        self.total_output = 0
+
+    @property
+    def temperature(self):
+        return float(self.engine.temperature[self.index])
+
+    @temperature.setter
+    def temperature(self, value):
+        self.engine.temperature[self.index] = value
+        self.engine.last_update[self.index] = self.engine.env.now
+
+    def current_temperature(self):
+        """Temperature at env.now, the room brought up to date"""
+        self.engine.advance(slice(self.index, self.index + 1))
+        return self.temperature
+
+    def couple(self, other, conductance):
+        """Exchange heat with the room other (see ThermalEngine.couple)"""
+        self.engine.couple(self, other, conductance)
+
+    @property
+    def low_equilibrium(self):
+        return float(self.engine.low_equilibrium[self.index])
+
+    @property
+    def volume(self):
+        return float(self.engine.volume[self.index])
+
+    def add_heat_source(self, heat_source):
+        """Add heat_source to active sources"""
+        if not heat_source in self.heat_sources:
+            self._set_contribution(heat_source, heat_output_of(heat_source))
+            heat_source.set_listener_callback(self.heat_source_output_changed)
+            _trace.info('++ Added source %s with output %d to room %d',
+                        heat_source.id, heat_source.heat_output, self.index)
+            self.sources_changed()
+
+    def remove_heat_source(self, heat_source):
+        """Remove heat_source from active sources"""
+        if heat_source in self.heat_sources:
+            self._set_contribution(heat_source, None)
+            heat_source.set_listener_callback(None)
+            _trace.info('-- Removed source %s with output %d from room %d',
+                        heat_source.id, heat_source.heat_output, self.index)
+            self.sources_changed()
+
+    def heat_source_output_changed(self, heat_source):
+        """React to change in output of heat_source"""
+        if heat_source in self.heat_sources:
+            self._set_contribution(heat_source, heat_output_of(heat_source))
+            _trace.info('** Source %s in room %d changed output to %d',
+                        heat_source.id, self.index,
+                        heat_source.heat_output if heat_source.heat_on else 0)
+            self.sources_changed()
+
+    def sources_changed(self): #private
+        self.engine.set_output(self.index, self.current_heat_from_sources())
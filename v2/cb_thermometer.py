@@ -1,14 +1,30 @@
-from cb_base import CbBase
+from .cb_base import CbBase
+from .cb_event import Event
+from .cb_trace import get_tracer
+
+_trace = get_tracer('thermometer')
 
 class CbThermometer(CbBase):
     """A computational bacterium measuring heat
+
+    Readings are put on the event stream as 'temp_measurement' events
+    (payload: the temperature, source: the thermometer id), or stored in
+    recorder (a cb_recorder.TemperatureRecorder) if one is given. With an
+    event_pool (a cb_event.EventPool) set, the events are taken from it
+    and the consumer of the readings releases them (as the temperature
+    listeners of cb_bench and cb_sweep do).
     """
-    def __init__(self, env, id, context, event_stream, event_kinds, period):
+    event_pool = None
+
+    def __init__(self, env, id, context, event_stream, event_kinds, period,
+                 recorder=None, scheduler=None):
 
-        super().__init__(env, id, context, event_stream, event_kinds, period)
+        super().__init__(env, id, context, event_stream, event_kinds, period,
+                         scheduler)
 
         #Thermometer properties
         self.last_temp_read = -1
+        self.recorder = recorder
 
 
 
@@ -16,7 +32,18 @@ class CbThermometer(CbBase):
         if self.context:
            self.last_temp_read = self.context.temperature 
         #print ("{} at {} measuring heat: {:.1f}".format(self.id,self.env.now,self.last_temp_read))
-        self.events.put(('temp_measurement',self.last_temp_read,self.env.now,self.id))
+        if self.recorder is not None:
+            self.recorder.record(self.id,self.env.now,self.last_temp_read)
+        else:
+            if self.event_pool is None:
+                event = Event('temp_measurement', None, self.env.now,
+                              self.last_temp_read, self.id)
+            else:
+                event = self.event_pool.acquire('temp_measurement', None,
+                                                self.env.now,
+                                                self.last_temp_read, self.id)
+            self.events.put(event)
 
     def on_interrupt_activity(self):
-        print('{} at {} thermometer interrupted with {}'.format(self.id,self.env.now,self.event))
+        _trace.info('%s at %s thermometer interrupted with %s',
+                    self.id,self.env.now,self.event)
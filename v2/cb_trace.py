@@ -0,0 +1,155 @@
+"""
+Leveled trace output for the simulation hot paths
+
+Replaces print() calls in the duty cycles of spaces and bacteria. Each
+component (e.g. 'space', 'heater') gets a Tracer from get_tracer(); its
+level is looked up once when tracing is configured, so a call site for a
+disabled component costs a single comparison.
+
+Messages are formatted lazily: a record keeps the format string and its
+arguments, and the % formatting only happens when the record is echoed to
+the console or written out. Records are kept in an in-memory ring buffer
+(oldest dropped first) that is flushed in bulk to a file with flush().
+
+Tracing is off by default. Scripts that want the old console output call
+configure(level=DEBUG, console=True).
+
+"""
+
+from collections import deque
+import sys
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+OFF = 100
+
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING'}
+
+
+class Tracer(object):
+    """Trace handle of one component, bound to a sink"""
+
+    def __init__(self, sink, component):
+        self.sink = sink
+        self.component = component
+        self.level = OFF
+
+    def enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, msg, *args):
+        if level >= self.level:
+            self.sink.emit(self.component, level, msg, args)
+
+    def debug(self, msg, *args):
+        if DEBUG >= self.level:
+            self.sink.emit(self.component, DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        if INFO >= self.level:
+            self.sink.emit(self.component, INFO, msg, args)
+
+    def warning(self, msg, *args):
+        if WARNING >= self.level:
+            self.sink.emit(self.component, WARNING, msg, args)
+
+
+class TraceSink(object):
+    """Ring buffer of trace records shared by all tracers.
+
+    capacity is the number of records kept in memory. If autoflush is a
+    file path, a full buffer is appended to it instead of dropping the
+    oldest records.
+    """
+
+    def __init__(self, capacity=100000, console=False, autoflush=None):
+        self.buffer = deque(maxlen=capacity)
+        self.console = console
+        self.autoflush = autoflush
+        self.dropped = 0
+        self.default_level = OFF
+        self.component_levels = {}
+        self.tracers = {}
+
+    def get_tracer(self, component):
+        if component not in self.tracers:
+            tracer = Tracer(self, component)
+            tracer.level = self.component_levels.get(component,
+                                                     self.default_level)
+            self.tracers[component] = tracer
+        return self.tracers[component]
+
+    def set_level(self, level, component=None):
+        """Set the level of component, or the default level of all
+        components without a level of their own"""
+        if component is None:
+            self.default_level = level
+        else:
+            self.component_levels[component] = level
+        for tracer in self.tracers.values():
+            tracer.level = self.component_levels.get(tracer.component,
+                                                     self.default_level)
+
+    def emit(self, component, level, msg, args):
+        if len(self.buffer) == self.buffer.maxlen:
+            if self.autoflush:
+                self.flush(self.autoflush)
+            else:
+                self.dropped += 1
+        self.buffer.append((component, level, msg, args))
+        if self.console:
+            print(msg % args if args else msg)
+
+    def records(self):
+        """Formatted lines of the buffered records, oldest first"""
+        for component, level, msg, args in self.buffer:
+            yield '%s %s: %s' % (LEVEL_NAMES.get(level, level), component,
+                                 msg % args if args else msg)
+
+    def flush(self, path=None):
+        """Write out buffered records in one go (to stdout if no path is
+        given) and empty the buffer"""
+        lines = '\n'.join(self.records())
+        if lines:
+            if path is None:
+                sys.stdout.write(lines + '\n')
+            else:
+                with open(path, 'a') as out:
+                    out.write(lines + '\n')
+        self.buffer.clear()
+
+
+SINK = TraceSink()
+
+
+def get_tracer(component):
+    return SINK.get_tracer(component)
+
+
+def configure(level=None, components=None, console=None, capacity=None,
+              autoflush=None):
+    """Configure the shared sink.
+
+    level applies to the given components (a name or list of names) or,
+    without components, to all of them. Tracers already handed out pick
+    up the change.
+    """
+    if capacity is not None:
+        SINK.buffer = deque(SINK.buffer, maxlen=capacity)
+    if console is not None:
+        SINK.console = console
+    if autoflush is not None:
+        SINK.autoflush = autoflush
+    if level is not None:
+        if components is None:
+            SINK.set_level(level)
+        else:
+            if isinstance(components, str):
+                components = (components,)
+            for component in components:
+                SINK.set_level(level, component)
+
+
+def flush(path=None):
+    SINK.flush(path)
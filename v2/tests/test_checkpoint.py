@@ -0,0 +1,90 @@
+import pytest
+import simpy
+
+from v2 import cb_checkpoint
+from v2.cb_containingspace import AnalyticContainingSpace, ContainingSpace
+from v2.cb_event import Event
+from v2.cb_eventbus import DROP_OLDEST, EventBus, KEEP_LATEST
+from v2.cb_heater import CbHeater
+from v2.cb_thermometer import CbThermometer
+
+ACTIONS = [(100, 'heat_on', 'h1'), (300, 'heat_on', 'h2'),
+           (650, 'heat_off', 'h1'), (1100, 'heat_on', 'h1'),
+           (1400, 'heat_off', 'h2'), (1400, 'heat_on', 'ghost')]
+CHECKPOINT = 730
+END = 2000
+
+
+def colony(env, space_class):
+    bus = EventBus(env, ['ping'])
+    bus.set_capacity('temp_measurement', 5, DROP_OLDEST)
+    bus.set_capacity('heat_on', 3, KEEP_LATEST, max_waiting=1)
+    bus.set_ttl('heat_on', 500)
+    rooms = [space_class(env, 288, 290, 75), space_class(env, 288, 295, 150)]
+    bacteria = []
+    for i, room in enumerate(rooms):
+        heater = CbHeater(env, 'h%d' % (i + 1), room, bus,
+                          ['ping', 'heat_on', 'heat_off'], 60, 100 * (i + 1))
+        room.add_heat_source(heater)
+        bacteria.append(heater)
+        bacteria.append(CbThermometer(env, 't%d' % (i + 1), room, bus,
+                                      ['ping'], 20 + 5 * i))
+    return bus, rooms, bacteria
+
+
+def driving(env, bus):
+    """The actions from env.now on, not part of a checkpoint"""
+    for time, kind, target in ACTIONS:
+        if time >= env.now:
+            yield env.timeout(time - env.now)
+            bus.put(Event(kind, target, env.now))
+
+
+def state(bus, rooms, bacteria):
+    return ([room.current_temperature() for room in rooms],
+            [(cb.id, getattr(cb, 'heat_on', None),
+              getattr(cb, 'last_temp_read', None), cb.remaining_sleep())
+             for cb in bacteria],
+            [(target, event.fields()) for target, event in bus.queued()],
+            bus.settings())
+
+
+@pytest.mark.parametrize('space_class',
+                         [ContainingSpace, AnalyticContainingSpace])
+def test_restored_run_equals_continuous_run(tmp_path, space_class):
+    env = simpy.Environment()
+    bus, rooms, bacteria = colony(env, space_class)
+    env.process(driving(env, bus))
+    env.run(until=END)
+    continuous = state(bus, rooms, bacteria)
+
+    env = simpy.Environment()
+    bus, rooms, bacteria = colony(env, space_class)
+    env.process(driving(env, bus))
+    env.run(until=CHECKPOINT)
+    path = str(tmp_path / 'colony.ckpt')
+    cb_checkpoint.save(path, cb_checkpoint.snapshot(env, rooms, bacteria,
+                                                    bus))
+    env, rooms, bacteria, bus = cb_checkpoint.restore(cb_checkpoint.load(path))
+    assert env.now == CHECKPOINT
+    env.process(driving(env, bus))
+    env.run(until=END)
+    restored = state(bus, rooms, bacteria)
+    assert restored[0] == pytest.approx(continuous[0])
+    assert restored[1:] == continuous[1:]
+
+
+def test_bus_settings_and_time_to_live_survive():
+    env = simpy.Environment(initial_time=10)
+    bus = EventBus(env)
+    bus.set_capacity('heat_on', 3, KEEP_LATEST, max_waiting=1)
+    bus.set_ttl('heat_off', 50)
+    bus.put(('heat_on', 'ghost', 10), ttl=30)
+    bus.put(('heat_off', 'ghost', 10))
+    env.run(until=20)
+    state = cb_checkpoint.snapshot(env, [], [], bus)
+    env, _, _, bus = cb_checkpoint.restore(state)
+    assert bus.settings() == {'capacities': {'heat_on': [3, KEEP_LATEST, 1]},
+                              'ttls': {'heat_off': 50}}
+    assert [expires_at for target, event, expires_at
+            in bus.queued(expiry=True)] == [40, 60]
@@ -0,0 +1,126 @@
+import pytest
+import simpy
+
+from containedspace import (AnalyticContainedSpace, ContainedSpace,
+                            HeatSource, heat_source_activity)
+from v2.cb_containingspace import AnalyticContainingSpace, ContainingSpace
+
+
+class Source(object):
+    """Heat source stand-in, switched by hand"""
+
+    def __init__(self, id, heat_output):
+        self.id = id
+        self.heat_output = heat_output
+        self.heat_on = False
+        self.listener_callback = None
+
+    def set_listener_callback(self, callable):
+        self.listener_callback = callable
+
+    def switch(self, heat_on=None, heat_output=None):
+        if heat_on is not None:
+            self.heat_on = heat_on
+        if heat_output is not None:
+            self.heat_output = heat_output
+        if self.listener_callback is not None:
+            self.listener_callback(self)
+
+
+def bursts(env, space):
+    """Bursts of source changes at 100, 130 and 400; returns the times at
+    which the duty cycle of space is interrupted"""
+    interrupts = []
+    interrupt = space.duty_process.interrupt
+    space.duty_process.interrupt = lambda *args: (
+        interrupts.append(env.now), interrupt(*args))
+    sources = [Source('a', 300), Source('b', 100), Source('c', 200)]
+
+    def changing():
+        yield env.timeout(100)
+        for source in sources:
+            space.add_heat_source(source)
+            source.switch(heat_on=True)
+        yield env.timeout(30)
+        space.remove_heat_source(sources[2])
+        sources[1].switch(heat_output=500)
+        sources[0].switch(heat_on=False)
+        space.add_heat_source(sources[2])
+        yield env.timeout(270)
+        sources[2].switch(heat_on=False)
+        sources[0].switch(heat_on=True)
+
+    env.process(changing())
+    return interrupts
+
+
+def test_burst_coalesced_into_one_interrupt():
+    temperatures = {}
+    interrupts = {}
+    for coalesce in (False, True):
+        env = simpy.Environment()
+        space = ContainingSpace(env, 288, 290, 75,
+                                coalesce_interrupts=coalesce)
+        interrupts[coalesce] = bursts(env, space)
+        temperatures[coalesce] = []
+        for time in range(110, 1000, 50):
+            env.run(until=time)
+            temperatures[coalesce].append(space.current_temperature())
+    assert interrupts[True] == [100, 130, 400]
+    assert len(interrupts[False]) == 6 + 4 + 2
+    assert space.coalesced_interrupts == 12 - 3
+    assert temperatures[True] == pytest.approx(temperatures[False])
+
+
+def grid_temperatures(env, space, until, step=30):
+    """Temperatures of space at every update of the periodic model (every
+    step seconds), read after the update at that time"""
+    temperatures = []
+
+    def probing():
+        while env.now + step <= until:
+            yield env.timeout(step)
+            yield env.timeout(0)  # after the update due now
+            temperatures.append(space.temperature)
+
+    env.process(probing())
+    env.run(until=until + 1)
+    return temperatures
+
+
+def test_analytic_containing_space_matches_periodic():
+    temperatures = []
+    for cls in (ContainingSpace, AnalyticContainingSpace):
+        env = simpy.Environment()
+        space = cls(env, 288, 290, 75)
+        sources = [Source('a', 300), Source('b', 100)]
+        for source in sources:
+            source.heat_on = True  # one change per action: no drift
+
+        def changing():
+            yield env.timeout(100)
+            space.add_heat_source(sources[0])
+            yield env.timeout(215)
+            space.add_heat_source(sources[1])
+            yield env.timeout(400)
+            sources[0].switch(heat_output=50)
+            yield env.timeout(500)
+            space.remove_heat_source(sources[1])
+
+        env.process(changing())
+        temperatures.append(grid_temperatures(env, space, 3000))
+    assert len(temperatures[0]) == 100
+    assert temperatures[1] == pytest.approx(temperatures[0])
+
+
+def test_analytic_contained_space_matches_periodic():
+    temperatures = []
+    for cls in (ContainedSpace, AnalyticContainedSpace):
+        env = simpy.Environment()
+        space = cls(env, 288, 290, 75)
+        sources = [HeatSource('1', 100), HeatSource('2', 300)]
+        env.process(heat_source_activity(env, space, [
+            (100, 'add', sources[0]), (215, 'add', sources[1]),
+            (400, 'change', sources[1], 50), (290, 'remove', sources[0])]))
+        temperatures.append(grid_temperatures(env, space, 2000))
+    assert temperatures[1] == pytest.approx(temperatures[0])
@@ -0,0 +1,72 @@
+import simpy
+
+from v2.cb_event import (Event, EventPool, event_key, kind_of, source_of,
+                         timestamp_of)
+from v2.cb_eventbus import EventBus
+
+
+def test_events_are_equal_only_to_themselves():
+    first = Event('heat_on', 'h1', 0)
+    second = Event('heat_on', 'h1', 0)
+    assert first == first
+    assert first != second
+    assert first.fields() == second.fields()
+    assert len(set([first, second, first])) == 2
+
+
+def test_pooled_event_is_reused_with_new_fields():
+    pool = EventPool()
+    first = pool.acquire('temp_measurement', None, 0, 290.0, 't1')
+    events = set([first])
+    pool.release(first)
+    second = pool.acquire('temp_measurement', None, 10, 291.0, 't2')
+    assert second is first
+    assert second.fields() == ('temp_measurement', None, 10, 291.0, 't2')
+    assert (pool.created, pool.reused) == (1, 1)
+    #the hash does not follow the fields
+    assert second in events
+
+
+def test_pool_capacity():
+    pool = EventPool(capacity=1)
+    events = [pool.acquire('ping') for _ in range(3)]
+    for event in events:
+        pool.release(event)
+    assert len(pool._free) == 1
+
+
+def test_pooled_events_on_the_bus():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    pool = EventPool()
+    readings = []
+
+    def thermometer():
+        for value in range(5):
+            yield bus.put(pool.acquire('temp_measurement', None, env.now,
+                                       290.0 + value, 't1'))
+            yield env.timeout(1)
+
+    def listener():
+        while True:
+            event = yield bus.get(['temp_measurement'])
+            readings.append((event.timestamp, event.payload))
+            pool.release(event)
+
+    env.process(thermometer())
+    env.process(listener())
+    env.run()
+    assert readings == [(t, 290.0 + t) for t in range(5)]
+    assert (pool.created, pool.reused) == (1, 4)
+
+
+def test_accessors_read_tuples_and_events():
+    event = Event('temp_measurement', None, 5, 290.0, 't1')
+    reading = ('temp_measurement', 290.0, 5, 't1')
+    heat_on = ('heat_on', 'h1', 5)
+    assert event_key(event) == event_key(reading) == ('temp_measurement', None)
+    assert event_key(heat_on) == ('heat_on', 'h1')
+    assert kind_of(heat_on) == 'heat_on'
+    assert timestamp_of(event) == timestamp_of(reading) == 5
+    assert source_of(event) == source_of(reading) == 't1'
+    assert source_of(heat_on) is None
@@ -0,0 +1,231 @@
+import simpy
+
+from v2.cb_event import Event
+from v2.cb_eventbus import (EventBus, BLOCK, DROP_OLDEST, DROP_NEWEST,
+                            KEEP_LATEST)
+
+
+def reading(value, source, now=0):
+    return Event('temp_measurement', None, now, value, source)
+
+
+def queued_events(bus):
+    return [event for target, event in bus.queued()]
+
+
+def test_drop_oldest():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('temp_measurement', 2, DROP_OLDEST)
+    for value in (1, 2, 3):
+        bus.put(reading(value, 't1'))
+    assert [event.payload for event in queued_events(bus)] == [2, 3]
+    assert bus.dropped['temp_measurement'] == 1
+    time, reason, target, event = bus.dead_letters[0]
+    assert (reason, target, event.payload) == ('dropped', None, 1)
+
+
+def test_drop_newest():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('temp_measurement', 2, DROP_NEWEST)
+    for value in (1, 2, 3):
+        bus.put(reading(value, 't1'))
+    assert [event.payload for event in queued_events(bus)] == [1, 2]
+    assert bus.dropped['temp_measurement'] == 1
+
+
+def test_keep_latest_per_source():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('temp_measurement', 10, KEEP_LATEST)
+    bus.put(reading(1, 't1'))
+    bus.put(reading(2, 't2'))
+    bus.put(reading(3, 't1'))
+    assert [(event.source, event.payload) for event in queued_events(bus)] \
+        == [('t2', 2), ('t1', 3)]
+
+
+def test_keep_latest_tuple_measurements():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('temp_measurement', 10, KEEP_LATEST)
+    bus.put(('temp_measurement', 290.0, 0, 't1'))
+    bus.put(('temp_measurement', 291.0, 1, 't1'))
+    assert queued_events(bus) == [('temp_measurement', 291.0, 1, 't1')]
+
+
+def test_keep_latest_heater_events_without_source():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('heat_on', 10, KEEP_LATEST)
+    bus.put(('heat_on', 'h1', 0))
+    bus.put(('heat_on', 'h2', 1))
+    #no source: the events replace each other
+    assert queued_events(bus) == [('heat_on', 'h2', 1)]
+
+
+def test_keep_latest_heater_events_by_target():
+    bus = EventBus(simpy.Environment())
+    bus.set_capacity('heat_on', 10, KEEP_LATEST,
+                     source_key=lambda event: event[1])
+    bus.put(('heat_on', 'h1', 0))
+    bus.put(('heat_on', 'h2', 1))
+    bus.put(('heat_on', 'h1', 2))
+    assert queued_events(bus) == [('heat_on', 'h2', 1), ('heat_on', 'h1', 2)]
+
+
+def test_block_holds_yielding_producer():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.set_capacity('heat_on', 1, BLOCK)
+    put_at = []
+
+    def producer():
+        for i in range(3):
+            yield bus.put(('heat_on', 'h1', env.now))
+            put_at.append(env.now)
+
+    def consumer():
+        while True:
+            yield env.timeout(10)
+            yield bus.get(['heat_on'], 'h1')
+
+    env.process(producer())
+    env.process(consumer())
+    env.run(until=25)
+    assert put_at == [0, 10, 20]
+    assert bus.blocked['heat_on'] == 2
+    assert bus.dropped['heat_on'] == 0
+
+
+def test_block_caps_waiting_puts():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.set_capacity('temp_measurement', 2, BLOCK, max_waiting=3)
+    for value in range(10):
+        bus.put(reading(value, 't1'))  # not yielded, like a thermometer
+    assert len(bus) == 2
+    assert bus.stats()['temp_measurement']['waiting_puts'] == 3
+    assert bus.dropped['temp_measurement'] == 5
+    #taking events lets the waiting puts in, oldest first
+    taken = [bus.get(['temp_measurement']).value.payload for _ in range(5)]
+    assert taken == [0, 1, 2, 3, 4]
+    assert bus.idle()
+
+
+def test_ttl_dead_letter_stamped_with_expiry_time():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.put(('heat_on', 'h1', 0), ttl=5)
+    bus.set_ttl('heat_off', 3)
+    bus.put(('heat_off', 'h1', 0))
+    env.run(until=20)
+    assert len(bus) == 2  # expiry is lazy
+    bus.expire()
+    assert len(bus) == 0
+    assert sorted(bus.dead_letters) == [
+        (3, 'expired', 'h1', ('heat_off', 'h1', 0)),
+        (5, 'expired', 'h1', ('heat_on', 'h1', 0))]
+
+
+def test_event_taken_before_expiry_is_delivered():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.put(('heat_on', 'h1', 0), ttl=5)
+    env.run(until=4)
+    assert bus.get(['heat_on'], 'h1').value == ('heat_on', 'h1', 0)
+    env.run(until=10)
+    bus.expire()
+    assert not bus.dead_letters
+
+
+def test_waiting_put_expires():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.set_capacity('heat_on', 1, BLOCK)
+    released = []
+
+    def producer():
+        yield bus.put(('heat_on', 'h1', env.now))
+        yield bus.put(('heat_on', 'h2', env.now), ttl=5)
+        released.append(env.now)
+
+    env.process(producer())
+    env.run(until=10)
+    assert released == []  # nobody put or got anything since
+    bus.expire()
+    env.run(until=11)
+    assert released == [10]
+    assert list(bus.dead_letters) == [
+        (5, 'expired', 'h2', ('heat_on', 'h2', 0))]
+    assert queued_events(bus) == [('heat_on', 'h1', 0)]
+
+
+def test_admitted_put_keeps_its_expiry_time():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.set_capacity('heat_on', 1, BLOCK)
+    bus.put(('heat_on', 'h1', 0))
+    bus.put(('heat_on', 'h2', 0), ttl=5)
+    env.run(until=2)
+    bus.get(['heat_on'], 'h1')  # makes room for the waiting put
+    assert queued_events(bus) == [('heat_on', 'h2', 0)]
+    env.run(until=6)
+    bus.expire()
+    assert list(bus.dead_letters) == [
+        (5, 'expired', 'h2', ('heat_on', 'h2', 0))]
+
+
+def test_undelivered_to_missing_receivers():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    bus.subscribe(['heat_on'], 'h1')
+    bus.set_ttl('heat_on', 1)
+    bus.put(('heat_on', 'h1', 0))
+    bus.put(('heat_on', 'ghost', 0))
+    bus.put(('temp_measurement', 290.1, 0, 't1'))
+    env.run(until=2)
+    summary = bus.undelivered()
+    assert summary[('heat_on', 'ghost')] == {
+        'expired': 1, 'dropped': 0, 'queued': 0, 'subscribed': False}
+    assert summary[('heat_on', 'h1')]['subscribed']
+    assert summary[('temp_measurement', None)]['queued'] == 1
+
+
+def test_broadcast_reaches_every_subscriber_once():
+    env = simpy.Environment()
+    bus = EventBus(env, broadcast_kinds=['ping'])
+    received = dict((id, []) for id in ('t1', 't2', 't3', 'h1'))
+
+    def receiver(id, kinds):
+        bus.subscribe(kinds, id)
+        while True:
+            event = yield bus.get(kinds, id)
+            received[id].append((env.now, event.kind, event.target))
+
+    for id in ('t1', 't2', 't3'):
+        env.process(receiver(id, ['ping']))
+    env.process(receiver('h1', ['heat_on']))
+
+    def sending():
+        yield env.timeout(1)
+        bus.put(Event('ping', None, env.now))
+        yield env.timeout(1)
+        bus.put(Event('ping', 't2', env.now))  # unicast
+        bus.put(Event('heat_on', 'h1', env.now))
+
+    env.process(sending())
+    env.run(until=10)
+    assert received['t1'] == received['t3'] == [(1, 'ping', None)]
+    assert received['t2'] == [(1, 'ping', None), (2, 'ping', 't2')]
+    assert received['h1'] == [(2, 'heat_on', 'h1')]
+    assert bus.dispatched['ping'] == 4
+    assert bus.idle()
+
+
+def test_broadcast_of_a_unicast_kind():
+    env = simpy.Environment()
+    bus = EventBus(env)
+    for id in ('h1', 'h2'):
+        bus.subscribe(['heat_off'], id)
+    bus.broadcast(('heat_off', None, 0))
+    bus.put(('heat_off', None, 0))  # to one receiver only
+    assert bus.get(['heat_off'], 'h1').value == ('heat_off', None, 0)
+    assert bus.get(['heat_off'], 'h2').value == ('heat_off', None, 0)
+    assert len(bus) == 1
@@ -0,0 +1,80 @@
+import simpy
+
+from v2.cb_containingspace import AnalyticContainingSpace
+from v2.cb_eventbus import EventBus
+from v2.cb_fastforward import FastForward
+from v2.cb_recorder import TemperatureRecorder
+from v2.cb_scenario import Facility
+from v2.cb_scheduler import TickScheduler
+from v2.cb_thermometer import CbThermometer
+
+SPEC = {'until': 20000, 'space_model': 'analytic',
+        'rooms': [{'id': 'r1', 'low_eq': 288, 'start_temp': 290},
+                  {'id': 'r2', 'low_eq': 289, 'start_temp': 289}],
+        'heaters': [{'id': 'h1', 'room': 'r1', 'output': 100},
+                    {'id': 'h2', 'room': 'r2', 'output': 300}],
+        'thermometers': [{'id': 't1', 'room': 'r1', 'period': 10},
+                         {'id': 't2', 'room': 'r1', 'period': 25},
+                         {'id': 't3', 'room': 'r2', 'period': 7}],
+        'actions': [[1000, 'add', 'h1'], [6000, 'add', 'h2'],
+                    [9000, 'change', 'h1'], [15000, 'remove', 'h2']]}
+
+
+def play(fast_forward):
+    env = simpy.Environment()
+    scheduler = TickScheduler(env) if fast_forward else None
+    recorder = TemperatureRecorder()
+    facility = Facility(env, SPEC, scheduler, recorder)
+    forward = None
+    if fast_forward:
+        forward = FastForward(env, facility.rooms.values(), scheduler,
+                              facility.driver, facility.event_queue,
+                              until=SPEC['until'])
+    env.run(until=SPEC['until'])
+    return facility, recorder, forward
+
+
+def series(recorder):
+    return dict((id, (list(recorder.times(id)), list(recorder.values(id))))
+                for id in recorder.series)
+
+
+def test_same_readings_as_a_normal_run():
+    facility, normal, _ = play(False)
+    facility, forwarded, forward = play(True)
+    assert forward.skipped_time() > SPEC['until'] / 2
+    assert series(forwarded) == series(normal)
+    assert facility.driver.applied == 4
+
+
+def test_reconstruct_skipped_readings():
+    facility, recorder, forward = play(True)
+    readings = forward.reconstruct('t2')
+    assert readings
+    times = list(recorder.times('t2'))
+    values = dict(zip(times, recorder.values('t2')))
+    for time, value in readings:
+        assert values[time] == value
+
+
+def test_fast_forward_leaves_one_stale_timeout():
+    env = simpy.Environment()
+    scheduler = TickScheduler(env)
+    room = AnalyticContainingSpace(env, 288, 288, 75)  # steady
+    bus = EventBus(env)
+    for i, period in enumerate([7, 11, 13, 17, 19, 23] * 5):
+        CbThermometer(env, 't%d' % i, room, bus, ['ping'], period + i,
+                      scheduler=scheduler)
+    env.run(until=1)
+    scheduler.fast_forward(10000)
+    #the timeout set for the earliest skipped bucket, nothing else
+    stale = []
+    while env.peek() < 10000:
+        if env.peek() > env.now:
+            stale.append(env.peek())
+        env.step()
+    assert stale == [7]
+    assert min(scheduler.buckets) >= 10000
+    ticks = scheduler.ticks
+    env.run(until=10050)
+    assert scheduler.ticks > ticks
@@ -0,0 +1,51 @@
+import gc
+
+from messaging import Message, MessageDispatcher
+
+
+class Receiver(object):
+
+    def __init__(self, name, log):
+        self.name = name
+        self.log = log
+
+    def receive(self, message):
+        self.log.append((self.name, message.topic, message.uid))
+
+
+def test_only_receivers_of_the_topic_and_all():
+    log = []
+    dispatcher = MessageDispatcher()
+    everything = Receiver('all', log)
+    heat = Receiver('heat', log)
+    other = Receiver('other', log)
+    both = Receiver('both', log)
+    dispatcher.register(everything)  # registered first, called last
+    dispatcher.register(heat, ['heat'])
+    dispatcher.register(other, ['light'])
+    dispatcher.register(both, ['heat', 'light'])
+    dispatcher.broadcast(Message(None, 'heat'))
+    dispatcher.broadcast(Message(heat, 'heat'))  # not back to its sender
+    assert log == [('heat', 'heat', 1), ('both', 'heat', 1),
+                   ('all', 'heat', 1),
+                   ('both', 'heat', 2), ('all', 'heat', 2)]
+    del log[:]
+    dispatcher.register(both, ['light'])  # replaces its registration
+    dispatcher.broadcast_many([Message(None, 'heat'), Message(None, 'dark')])
+    assert log == [('heat', 'heat', 3), ('all', 'heat', 3),
+                   ('all', 'dark', 4)]
+
+
+def test_collected_receiver_is_removed():
+    log = []
+    dispatcher = MessageDispatcher()
+    kept = Receiver('kept', log)
+    dispatcher.register(kept, ['heat'])
+    dispatcher.register(Receiver('gone', log), ['heat'])
+    dispatcher.register(Receiver('gone too', log))
+    gc.collect()
+    assert len(dispatcher) == 1
+    dispatcher.broadcast(Message(None, 'heat'))
+    assert log == [('kept', 'heat', 1)]
+    assert list(dispatcher._topics['heat']) == [kept]
+    assert not dispatcher._all
@@ -0,0 +1,32 @@
+import pytest
+
+from v2.cb_recorder import CsvSink, TemperatureRecorder
+
+
+def recorded(recorder):
+    for i in range(10):
+        recorder.record('t1', 10 * i, 290.0 + i)
+    return recorder
+
+
+def test_queries():
+    recorder = recorded(TemperatureRecorder())
+    assert recorder.latest('t1') == (90, 299.0)
+    times, values = recorder.window('t1', 20, 50)
+    assert list(times) == [20, 30, 40, 50]
+    assert recorder.mean('t1', 20, 50) == 293.5
+    assert recorder.mean('t1', 91, 100) is None
+
+
+def test_queries_need_readings_in_memory(tmp_path):
+    path = str(tmp_path / 'readings.csv')
+    recorder = recorded(TemperatureRecorder(CsvSink(path), chunk_size=4,
+                                            keep_in_memory=False))
+    recorder.close()
+    for query in (lambda: recorder.latest('t1'),
+                  lambda: recorder.window('t1', 0, 100),
+                  lambda: recorder.mean('t1', 0, 100)):
+        with pytest.raises(RuntimeError):
+            query()
+    with open(path) as rows:
+        assert len(rows.readlines()) == 1 + 10
@@ -0,0 +1,87 @@
+import simpy
+
+from v2.cb_containingspace import ContainingSpace
+from v2.cb_event import Event
+from v2.cb_eventbus import EventBus
+from v2.cb_heater import CbHeater
+from v2.cb_replay import (BROADCAST, DELIVER, GET, INTERRUPT, PUT, Replay,
+                          TraceRecorder, diff_traces, read_trace)
+from v2.cb_thermometer import CbThermometer
+
+KINDS = ['ping', 'heat_on', 'heat_off']
+
+
+def colony(env):
+    """A room with a heater and a thermometer on a bus; returns the bus,
+    the room and the bacteria"""
+    bus = EventBus(env)
+    room = ContainingSpace(env, 288, 290, 5*5*3)
+    heater = CbHeater(env, 'h1', room, bus, KINDS, 60, 300)
+    room.add_heat_source(heater)
+    thermometer = CbThermometer(env, 't1', room, bus, ['ping'], 20)
+    return bus, room, [heater, thermometer]
+
+
+def record(path):
+    env = simpy.Environment()
+    bus, room, bacteria = colony(env)
+
+    def driving():
+        for kind in ('heat_on', 'heat_off', 'heat_on'):
+            yield env.timeout(100)
+            bus.put(Event(kind, 'h1', env.now))
+            yield env.timeout(50)
+            bus.broadcast(Event('ping', None, env.now))
+            yield env.timeout(50)
+            bus.deliver(('heat_off', None, env.now), 'h1')
+
+    def listening():
+        while True:
+            yield bus.get(['temp_measurement'])
+
+    env.process(driving())
+    env.process(listening())
+    with TraceRecorder(path) as recorder:
+        recorder.attach(bus, [room], bacteria)
+        env.run(until=700)
+    return room.temperature
+
+
+def test_replay_reproduces_interrupts_and_gets(tmp_path):
+    recorded = str(tmp_path / 'recorded.trace')
+    replayed = str(tmp_path / 'replayed.trace')
+    temperature = record(recorded)
+    records = read_trace(recorded)
+    kinds = set(record[0] for record in records)
+    assert set([PUT, BROADCAST, DELIVER, GET, INTERRUPT]) <= kinds
+
+    env = simpy.Environment()
+    bus, room, bacteria = colony(env)
+
+    def listening():
+        while True:
+            yield bus.get(['temp_measurement'])
+
+    env.process(listening())
+    with TraceRecorder(replayed) as recorder:
+        recorder.attach(bus, [room], bacteria)
+        replay = Replay(env, records, bus, [room], bacteria, kinds=KINDS)
+        env.run(until=700)
+    assert replay.applied == len(replay.schedule) == 9
+    assert diff_traces(records, read_trace(replayed),
+                       kinds=(INTERRUPT, GET)) is None
+    assert room.temperature == temperature
+
+
+def test_payloads_round_trip(tmp_path):
+    path = str(tmp_path / 'payloads.trace')
+    payloads = [None, True, 3, 2.5, 'on', (1, 'a', None), [290.0, [1]],
+                {'setpoint': 293.0, 'zones': ('a', 'b')}, frozenset([1]),
+                lambda: None]
+    with TraceRecorder(path) as recorder:
+        for time, payload in enumerate(payloads):
+            recorder.put(time, Event('set', 'h1', time, payload))
+    assert recorder.unpicklable == 1
+    decoded = [record[2].payload for record in read_trace(path)]
+    assert decoded[:-1] == payloads[:-1]
+    assert decoded[-1].startswith('<function')
@@ -0,0 +1,89 @@
+import pytest
+import simpy
+
+from v2 import cb_scenario
+from v2.cb_event import Event
+from v2.cb_scenario import (ADD, CHANGE, OUTPUT, REMOVE, Facility,
+                            compile_actions)
+
+HEATERS = {'h1': 0, 'h2': 1}
+
+
+def spec(actions, **options):
+    return dict(options,
+                rooms=[{'id': 'r1', 'low_eq': 288, 'start_temp': 290,
+                        'volume': 75}],
+                heaters=[{'id': 'h1', 'room': 'r1', 'output': 100},
+                         {'id': 'h2', 'room': 'r1', 'output': 200}],
+                thermometers=[{'id': 't1', 'room': 'r1', 'period': 10}],
+                actions=actions)
+
+
+def test_actions_sorted_by_time_keeping_their_order():
+    schedule = compile_actions([[300, 'remove', 'h1'],
+                                {'at': 100, 'do': 'add', 'heater': 'h2'},
+                                [100, 'output', 'h1', 250],
+                                [200, 'change', 'h2']], HEATERS)
+    assert list(schedule.times) == [100, 100, 200, 300]
+    assert list(schedule.actions) == [ADD, OUTPUT, CHANGE, REMOVE]
+    assert list(schedule.heaters) == [1, 0, 1, 0]
+    assert list(schedule.values) == [0, 250, 0, 0]
+    assert list(schedule.batches()) == [(100, 0, 2), (200, 2, 3),
+                                        (300, 3, 4)]
+
+
+def test_relative_times():
+    schedule = compile_actions([[100, 'add', 'h1'], [50, 'change', 'h1'],
+                                [0, 'remove', 'h1']], HEATERS,
+                               relative_times=True)
+    assert list(schedule.times) == [100, 150, 150]
+
+
+def test_unknown_heater_or_action():
+    with pytest.raises(ValueError):
+        compile_actions([[100, 'add', 'h3']], HEATERS)
+    with pytest.raises(ValueError):
+        compile_actions([[100, 'explode', 'h1']], HEATERS)
+
+
+def test_changes_follow_the_intended_state():
+    env = simpy.Environment()
+    facility = Facility(env, spec([[100, 'add', 'h1'],
+                                   [200, 'change', 'h1'],
+                                   [200, 'change', 'h1'],
+                                   [300, 'change', 'h2'],
+                                   [300, 'change', 'h2']]))
+    sent = []
+    put = facility.event_queue.put
+    facility.event_queue.put = lambda event: sent.append(event.kind) or \
+        put(event)
+    env.run(until=250)
+    assert facility.results()['heaters_on'] == ['h1']
+    env.run(until=350)
+    assert [kind for kind in sent if kind != 'temp_measurement'] == \
+        ['heat_on', 'heat_off', 'heat_on', 'heat_on', 'heat_off']
+    assert facility.results()['heaters_on'] == ['h1']
+    assert facility.driver.applied == 5
+
+
+def created_events(monkeypatch, actions):
+    """Number of Events the driver creates for a run of actions"""
+    created = []
+
+    def counting(*fields):
+        created.append(fields)
+        return Event(*fields)
+
+    monkeypatch.setattr(cb_scenario, 'Event', counting)
+    env = simpy.Environment()
+    facility = Facility(env, spec(actions))
+    env.run(until=100000)
+    assert facility.driver.applied == len(actions)
+    return len(created)
+
+
+def test_events_do_not_grow_with_the_actions(monkeypatch):
+    few = [[10 * i, 'change', 'h%d' % (i % 2 + 1)] for i in range(1, 10)]
+    many = [[10 * i, 'change', 'h%d' % (i % 2 + 1)] for i in range(1, 5000)]
+    assert created_events(monkeypatch, few) == 4  # one pair per heater
+    assert created_events(monkeypatch, many) == 4
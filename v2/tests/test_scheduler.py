@@ -0,0 +1,73 @@
+import simpy
+
+from v2.cb_containingspace import AnalyticContainingSpace
+from v2.cb_event import Event
+from v2.cb_eventbus import EventBus
+from v2.cb_recorder import TemperatureRecorder
+from v2.cb_scheduler import TickScheduler
+from v2.cb_thermometer import CbThermometer
+
+
+def colony(scheduler_class, periods, pings=()):
+    """Thermometers with the given periods in one room, pinged at the
+    given (time, thermometer id) pairs; returns the environment, the
+    scheduler (or None) and the recorder"""
+    env = simpy.Environment()
+    scheduler = scheduler_class(env) if scheduler_class else None
+    recorder = TemperatureRecorder()
+    room = AnalyticContainingSpace(env, 288, 295, 75)  # cooling down
+    bus = EventBus(env)
+    for i, period in enumerate(periods):
+        CbThermometer(env, 't%d' % i, room, bus, ['ping'], period,
+                      recorder=recorder, scheduler=scheduler)
+
+    def pinging():
+        for time, id in pings:
+            yield env.timeout(time - env.now)
+            bus.put(Event('ping', id, env.now))
+
+    env.process(pinging())
+    return env, scheduler, recorder
+
+
+def series(recorder):
+    return dict((id, (list(recorder.times(id)), list(recorder.values(id))))
+                for id in recorder.series)
+
+
+def test_equal_periods_share_one_timeout():
+    env, scheduler, recorder = colony(TickScheduler, [10] * 50 + [15] * 50)
+    env.run(until=61)
+    #10, 20, ..., 60 and 15, 30, 45, 60, both at 30 and 60 in one bucket
+    #each: one timeout per distinct wake up time
+    assert scheduler.ticks == len(set(range(10, 61, 10)) |
+                                  set(range(15, 61, 15)))
+    assert len(recorder) == 50 * 6 + 50 * 4
+
+
+def test_same_readings_as_own_timers():
+    pings = [(5, 't0'), (12.5, 't1'), (40, 't2'), (40, 't0')]
+    periods = [10, 10, 7, 3]
+    env, scheduler, shared = colony(TickScheduler, periods, pings)
+    env.run(until=100)
+    env, _, own = colony(None, periods, pings)
+    env.run(until=100)
+    assert series(shared) == series(own)
+
+
+def test_interrupt_keeps_the_wake_up_time():
+    env, scheduler, recorder = colony(TickScheduler, [10], [(4, 't0')])
+    env.run(until=5)
+    assert list(scheduler.buckets) == [10]
+    env.run(until=25)
+    assert list(recorder.times('t0')) == [10, 20]
+
+
+def test_interrupt_after_remove():
+    env, scheduler, recorder = colony(TickScheduler, [10], [(15, 't0')])
+    env.run(until=12)
+    cb = next(iter(scheduler._due))
+    scheduler.remove(cb)
+    env.run(until=40)  # the ping still reaches the listening bacterium
+    assert list(recorder.times('t0')) == [10]
+    assert not scheduler._due
@@ -0,0 +1,15 @@
+import pytest
+
+from v2.cb_shard import run_sharded, run_single
+
+
+def test_two_shards_equal_one_process():
+    single = run_single(8, until=600, seed=7)
+    assert [result['room'] for result in single] == list(range(8))
+    assert run_sharded(8, 2, until=600, seed=7) == single
+    assert run_single(8, until=600, seed=8) != single
+
+
+def test_lookahead_shorter_than_window():
+    with pytest.raises(ValueError):
+        run_single(2, until=100, window=10, lookahead=5)
@@ -0,0 +1,31 @@
+from v2.cb_sweep import (SCENARIOS, run_point, run_seed, sweep,
+                         sweep_points)
+
+
+def results(records):
+    return sorted((record.index, record.seed, sorted(record.params.items()),
+                   record.result) for record in records)
+
+
+def test_seed_axis_runs_every_point_per_seed():
+    grid = {'until': [500], 'seed': [1, 2]}
+    first = results(sweep(SCENARIOS['room'], grid, processes=1))
+    assert [params for index, seed, params, result in first] == [
+        [('seed', 1), ('until', 500)], [('seed', 2), ('until', 500)]]
+    assert first[0][1] == run_seed(1, 0) and first[1][1] == run_seed(2, 0)
+    assert first[0][3] != first[1][3]
+    assert results(sweep(SCENARIOS['room'], grid, processes=1)) == first
+    #the same run as the first point of a sweep with that base seed
+    single = run_point(SCENARIOS['room'], 0, {'until': 500}, run_seed(2, 0))
+    assert single.result == first[1][3]
+
+
+def test_points_without_seed_axis():
+    points = list(sweep_points({'volume': [75, 150]}, base_seed=7))
+    assert points == [(0, {'volume': 75}, run_seed(7, 0)),
+                      (1, {'volume': 150}, run_seed(7, 1))]
+    points = list(sweep_points({'volume': [75, 150], 'seed': [3, 4]}))
+    assert [(index, params['volume'], seed)
+            for index, params, seed in points] == [
+        (0, 75, run_seed(3, 0)), (1, 75, run_seed(4, 0)),
+        (2, 150, run_seed(3, 1)), (3, 150, run_seed(4, 1))]
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+import simpy
+
+from v2 import cb_thermalengine
+from v2.cb_containingspace import ContainingSpace
+from v2.cb_thermalengine import ThermalEngine, _Network
+
+
+def building(rooms, couplings):
+    """Engine with rooms given as (low_eq, start_temp) and couplings as
+    (a, b, conductance)"""
+    engine = ThermalEngine(simpy.Environment())
+    for low_eq, start_temp in rooms:
+        engine.add_room(low_eq, start_temp, 75)
+    for a, b, conductance in couplings:
+        engine.couple(a, b, conductance)
+    return engine
+
+
+def test_sparse_flow_matches_bincount_flow():
+    pytest.importorskip('scipy.sparse')
+    rng = np.random.RandomState(1)
+    count = 50
+    couplings = {}
+    for _ in range(200):
+        a, b = sorted(rng.choice(count, 2, replace=False))
+        couplings[(a, b)] = rng.uniform(1, 100)
+    temperature = rng.uniform(280, 300, count)
+    network = _Network(count, couplings)
+    assert network.laplacian is not None
+    sparse_flow = network.flow(temperature)
+    network.laplacian = None
+    np.testing.assert_allclose(sparse_flow, network.flow(temperature))
+
+
+def test_exchange_conserves_heat(monkeypatch):
+    monkeypatch.setattr(cb_thermalengine, 'sparse', None)
+    engine = building([(280, 290), (280, 300), (280, 295)],
+                      [(0, 1, 50), (1, 2, 50)])
+    engine.exchange(60)
+    temperature = engine.temperature[:3]
+    assert temperature.sum() == pytest.approx(885)
+    assert temperature[0] > 290 and temperature[1] < 300
+
+
+def test_exchange_keeps_rooms_above_low_equilibrium():
+    engine = building([(295, 295), (280, 280)], [(0, 1, 1000)])
+    engine.env.run(until=engine.cycle_length + 1)
+    assert engine.temperature[0] == 295
+    assert engine.temperature[1] > 280
+
+
+class Source(object):
+    """Heat source stand-in, switched by hand"""
+
+    def __init__(self, id, heat_output):
+        self.id = id
+        self.heat_output = heat_output
+        self.heat_on = False
+        self.listener_callback = None
+
+    def set_listener_callback(self, callable):
+        self.listener_callback = callable
+
+    def switch(self, heat_on=None, heat_output=None):
+        if heat_on is not None:
+            self.heat_on = heat_on
+        if heat_output is not None:
+            self.heat_output = heat_output
+        if self.listener_callback is not None:
+            self.listener_callback(self)
+
+
+def two_rooms(env, add_room):
+    """Two rooms with heat sources added, changed and removed, also in the
+    middle of update cycles and twice at one time"""
+    rooms = [add_room(288, 290, 75), add_room(288, 295, 150)]
+    sources = [Source('a', 300), Source('b', 100), Source('c', 200)]
+
+    def changing():
+        yield env.timeout(100)
+        for source, room in zip(sources, [0, 0, 1]):
+            rooms[room].add_heat_source(source)
+            source.switch(heat_on=True)
+        yield env.timeout(413)
+        sources[0].switch(heat_on=False)
+        yield env.timeout(250)
+        rooms[1].remove_heat_source(sources[2])
+        sources[1].switch(heat_output=500)
+
+    env.process(changing())
+    return rooms
+
+
+def test_rooms_follow_containing_spaces():
+    env = simpy.Environment()
+    spaces = two_rooms(env, lambda *args: ContainingSpace(env, *args))
+    engine = ThermalEngine(simpy.Environment())
+    rooms = two_rooms(engine.env, engine.add_room)
+    for time in (120, 540, 700, 800, 1000, 2000, 5000):
+        env.run(until=time)
+        engine.env.run(until=time)
+        for space, room in zip(spaces, rooms):
+            assert room.current_temperature() == \
+                pytest.approx(space.current_temperature())